@@ -0,0 +1,98 @@
+"""Compares the per-call MessageGenerator loop with the batch API.
+
+    python benchmarks/batch.py --count 5000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from message_generator import (  # noqa: E402
+    DefaultTags,
+    MessageGenerator,
+    TerminalStatusResponseCode,
+    TransactionResponseCode,
+)
+from xml_parser import XMLParser  # noqa: E402
+
+CARD = {
+    'account_number': '**********1234',
+    'expiration_date': '2512',
+    'card_issuer': 'VS',
+    'original_transaction_amount': 400,
+    'currency_code': 'EUR',
+}
+
+
+def frame(xml: str) -> bytes:
+    return f"\x02\n{xml}\x03".encode()
+
+
+def loop_status(tags, codes):
+    return b"".join(frame(XMLParser.dict_to_xml(
+        MessageGenerator.get_terminal_status_emv_message(t, c)))
+        for t, c in zip(tags, codes))
+
+
+def loop_transaction(tags, codes):
+    return b"".join(frame(XMLParser.dict_to_xml(
+        MessageGenerator.get_transaction_emv_response_message(t, c, **CARD)))
+        for t, c in zip(tags, codes))
+
+
+def batch_status(tags, codes):
+    return MessageGenerator.get_terminal_status_emv_messages(tags, codes)
+
+
+def batch_transaction(tags, codes):
+    return MessageGenerator.get_transaction_emv_response_messages(
+        tags, codes, **CARD)
+
+
+def best_of(function, args, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    tags = [DefaultTags(i, 1, 1, 1, "T0000001") for i in range(args.count)]
+    status_codes = [TerminalStatusResponseCode.IDLE] * args.count
+    transaction_codes = [TransactionResponseCode.AUTHORISED] * args.count
+
+    results = {}
+    for name, loop, batch, codes in (
+        ("terminal_status_emv", loop_status, batch_status, status_codes),
+        ("transaction_emv", loop_transaction, batch_transaction,
+         transaction_codes),
+    ):
+        loop_s = best_of(loop, (tags, codes), args.repeat)
+        batch_s = best_of(batch, (tags, codes), args.repeat)
+        results[name] = {
+            'loop_msgs_per_s': args.count / loop_s,
+            'batch_msgs_per_s': args.count / batch_s,
+            'speedup': loop_s / batch_s,
+        }
+        print(f"{name}: loop {args.count / loop_s:,.0f} msg/s, "
+              f"batch {args.count / batch_s:,.0f} msg/s, "
+              f"speedup {loop_s / batch_s:.1f}x")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Load generator for the headless server (src/headless.py).
+
+Every connection sends TransactionEMV requests back to back, waiting for the
+final TransactionEMV response before sending the next one, and reports
+throughput and latency percentiles.
+
+    python src/headless.py --workers 4 &
+    python benchmarks/load.py --connections 64 --duration 10
+
+With `unix_socket_path` set in the config, `--unix PATH` connects through
+the Unix domain socket instead of TCP.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import re
+import statistics
+import time
+
+STX = b"\x02"
+ETX = b"\x03"
+
+REQUEST_TEMPLATE = """<?xml version="1.0" ?>
+<TransactionEMV>
+  <MerchantTransactionID>{merchant_transaction_id}</MerchantTransactionID>
+  <ZRNumber>1</ZRNumber>
+  <DeviceNumber>1</DeviceNumber>
+  <DeviceType>1</DeviceType>
+  <TerminalID>{terminal_id}</TerminalID>
+  <TransactionType>PURCHASE</TransactionType>
+  <TransactionAmount>4.00</TransactionAmount>
+  <CurrencyCode>EUR</CurrencyCode>
+</TransactionEMV>
+"""
+
+MERCHANT_TRANSACTION_ID = re.compile(
+    rb"<MerchantTransactionID>\s*([^<]*?)\s*</MerchantTransactionID>")
+RESPONSE_CODE = re.compile(rb"<ResponseCode>\s*([^<]*?)\s*</ResponseCode>")
+
+transaction_ids = itertools.count(1)
+
+
+def frame_request(xml: str) -> bytes:
+    # the XML declaration has to start right after STX
+    return STX + xml.strip().encode() + ETX
+
+
+def is_approved(frame: bytes, merchant_transaction_id: int) -> bool:
+    """True for an AUTHORISED (000) response to the given request, rejects
+    and Terminal busy answers are TransactionEMV frames as well."""
+    transaction_id = MERCHANT_TRANSACTION_ID.search(frame)
+    response_code = RESPONSE_CODE.search(frame)
+    return (transaction_id is not None and response_code is not None
+            and transaction_id.group(1) == str(merchant_transaction_id).encode()
+            and response_code.group(1) == b"000")
+
+
+def build_request(terminal_id: str) -> tuple[int, bytes]:
+    merchant_transaction_id = next(transaction_ids)
+    return merchant_transaction_id, frame_request(REQUEST_TEMPLATE.format(
+        merchant_transaction_id=merchant_transaction_id,
+        terminal_id=terminal_id))
+
+
+async def open_connection(args, port: int):
+    if args.unix:
+        return await asyncio.open_unix_connection(args.unix)
+    return await asyncio.open_connection(args.host, port)
+
+
+async def run_connection(args, port: int, deadline: float,
+                         latencies: list[float], errors: list[str],
+                         failures: list[bytes]):
+    try:
+        reader, writer = await open_connection(args, port)
+    except OSError as e:
+        errors.append(str(e))
+        return
+
+    terminal_id = f"LOAD{port}"
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            merchant_transaction_id, request = build_request(terminal_id)
+            writer.write(request)
+            await writer.drain()
+
+            # skip status and display messages until the final response
+            while True:
+                frame = await reader.readuntil(ETX)
+                if b"<TransactionEMV>" in frame:
+                    break
+            if is_approved(frame, merchant_transaction_id):
+                latencies.append(time.perf_counter() - started)
+            else:
+                failures.append(frame)
+    except (OSError, asyncio.IncompleteReadError) as e:
+        errors.append(str(e))
+    finally:
+        writer.close()
+
+
+async def run(args) -> dict:
+    latencies: list[float] = []
+    errors: list[str] = []
+    failures: list[bytes] = []
+    deadline = time.perf_counter() + args.duration
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_connection(args, args.ports[i % len(args.ports)], deadline,
+                       latencies, errors, failures)
+        for i in range(args.connections)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    result = {
+        'transport': "unix" if args.unix else "tcp",
+        'connections': args.connections,
+        'duration_s': elapsed,
+        'requests': len(latencies),
+        'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+        'errors': len(errors),
+        # answered, but not AUTHORISED for the request sent
+        'failed': len(failures),
+    }
+    if latencies:
+        result.update({
+            'latency_p50_ms': statistics.median(latencies) * 1000,
+            'latency_p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+            'latency_max_ms': latencies[-1] * 1000,
+        })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--ports", type=int, nargs="+", default=[2605],
+                        help="connections are spread over these ports")
+    parser.add_argument("--unix", metavar="PATH",
+                        help="connect to this Unix domain socket instead "
+                             "of TCP")
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
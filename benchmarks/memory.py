@@ -0,0 +1,103 @@
+"""Memory held by 10k live sessions' request state, nested dicts from
+XMLParser.parse plus card dicts versus the slotted records from
+request_types.parse_request and CardProfile.
+
+    python benchmarks/memory.py --sessions 10000
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from xml_parser import XMLParser  # noqa: E402
+from request_types import parse_request  # noqa: E402
+from terminal_config import CardProfile  # noqa: E402
+
+REQUEST_TEMPLATE = """<?xml version="1.0" ?>
+<TransactionEMV>
+  <MerchantTransactionID>{i}</MerchantTransactionID>
+  <ZRNumber>1</ZRNumber>
+  <DeviceNumber>1</DeviceNumber>
+  <DeviceType>1</DeviceType>
+  <TerminalID>T{i:07d}</TerminalID>
+  <TransactionType>PURCHASE</TransactionType>
+  <TransactionAmount>{i}.00</TransactionAmount>
+  <CurrencyCode>EUR</CurrencyCode>
+  <TimeoutResponse>30</TimeoutResponse>
+</TransactionEMV>
+"""
+
+
+def dict_session(xml: str, i: int) -> tuple:
+    card = {
+        "card_number": f"**********{i:04d}",
+        "expiration_date": "2512",
+        "cvv": "353",
+        "card_issuer": "VS",
+        "card_type": "CHIP",
+    }
+    return XMLParser.parse(xml), card
+
+
+def record_session(xml: str, i: int) -> tuple:
+    card = CardProfile(
+        card_number=f"**********{i:04d}",
+        expiration_date="2512",
+        cvv="353",
+        card_issuer="VS",
+        card_type="CHIP",
+    )
+    return parse_request(xml), card
+
+
+def measure(build, requests: list[str]) -> tuple[int, list]:
+    gc.collect()
+    tracemalloc.start()
+    sessions = [build(xml, i) for i, xml in enumerate(requests)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, sessions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    requests = [REQUEST_TEMPLATE.format(i=i) for i in range(args.sessions)]
+
+    dict_bytes, dict_sessions = measure(dict_session, requests)
+    record_bytes, record_sessions = measure(record_session, requests)
+
+    parsed, _ = dict_sessions[0]
+    record, _ = record_sessions[0]
+    dict_access = min(timeit.repeat(
+        lambda: XMLParser.get_value(parsed, 'TerminalID'), number=100000))
+    record_access = min(timeit.repeat(
+        lambda: record.default_tags.terminal_id, number=100000))
+
+    results = {
+        'sessions': args.sessions,
+        'dict_bytes_per_session': dict_bytes / args.sessions,
+        'record_bytes_per_session': record_bytes / args.sessions,
+        'dict_access_ns': dict_access * 1e9 / 100000,
+        'record_access_ns': record_access * 1e9 / 100000,
+    }
+    print(f"dicts:   {dict_bytes / args.sessions:.0f} B/session, "
+          f"TerminalID lookup {results['dict_access_ns']:.0f} ns")
+    print(f"records: {record_bytes / args.sessions:.0f} B/session, "
+          f"TerminalID lookup {results['record_access_ns']:.0f} ns")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Measures kiosk startup: time from process start to the first painted frame
+and the slowest imports reported by `python -X importtime`.
+
+Run from the repository root:
+    python benchmarks/startup.py --runs 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+FIRST_PAINT_RE = re.compile(r"First paint after ([\d.]+) ms")
+IMPORT_TIME_RE = re.compile(
+    r"import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)")
+
+
+def run_once(offscreen: bool) -> tuple[float, float, list[tuple[str, int, int]]]:
+    env = dict(os.environ)
+    if offscreen:
+        env["QT_QPA_PLATFORM"] = "offscreen"
+
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "src/main.py",
+         "--exit-after-first-paint"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env)
+
+    first_paint_wall_ms = None
+    first_paint_main_ms = None
+    for line in process.stdout:
+        match = FIRST_PAINT_RE.search(line)
+        if match:
+            first_paint_wall_ms = (time.perf_counter() - started) * 1000
+            first_paint_main_ms = float(match.group(1))
+    _, stderr = process.communicate()
+
+    if first_paint_wall_ms is None:
+        raise RuntimeError(f"main.py exited without painting:\n{stderr}")
+
+    imports = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_RE.match(line)
+        if match:
+            depth = (len(match.group(3)) - 1) // 2
+            imports.append((match.group(4), int(match.group(2)), depth))
+
+    return first_paint_wall_ms, first_paint_main_ms, imports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15,
+                        help="number of top level imports to list")
+    parser.add_argument("--offscreen", action="store_true",
+                        help="use the offscreen Qt platform plugin")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    wall_times = []
+    main_times = []
+    imports = []
+    for _ in range(args.runs):
+        wall_ms, main_ms, imports = run_once(args.offscreen)
+        wall_times.append(wall_ms)
+        main_times.append(main_ms)
+
+    top_level = sorted((entry for entry in imports if entry[2] == 0),
+                       key=lambda entry: entry[1], reverse=True)[:args.top]
+
+    print(f"first paint (process start): "
+          f"median {statistics.median(wall_times):.1f} ms, "
+          f"min {min(wall_times):.1f} ms")
+    print(f"first paint (main.py start): "
+          f"median {statistics.median(main_times):.1f} ms")
+    print("slowest top level imports (cumulative):")
+    for name, cumulative_us, _ in top_level:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({
+                "first_paint_ms": statistics.median(wall_times),
+                "first_paint_main_ms": statistics.median(main_times),
+                "runs": wall_times,
+                "imports_ms": {name: cumulative_us / 1000
+                               for name, cumulative_us, _ in top_level},
+            }, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
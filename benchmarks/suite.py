@@ -0,0 +1,496 @@
+"""Benchmark suite for the hot paths, with JSON baselines and a regression
+check.
+
+    python benchmarks/suite.py run --output baseline.json
+    ... change things ...
+    python benchmarks/suite.py run --output current.json
+    python benchmarks/suite.py compare baseline.json current.json --threshold 0.1
+
+`compare` exits with status 1 when any benchmark is slower than its baseline
+by more than the threshold. Benchmarks whose dependencies (PySide6 for the
+framing and loopback ones, the openssl command for the TLS ones) are not
+installed are skipped.
+"""
+import argparse
+import atexit
+import functools
+import json
+import os
+import platform
+import shutil
+import socket
+import ssl
+import threading
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from typing import Callable
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+
+from message_generator import (  # noqa: E402
+    DefaultTags,
+    DisplayMessageLevel,
+    MessageGenerator,
+    TerminalMessageResponseCode,
+    TerminalStatusResponseCode,
+    TransactionCancelCode,
+    TransactionResponseCode,
+    current_time_tags,
+)
+from request_types import parse_request  # noqa: E402
+from xml_parser import XMLParser  # noqa: E402
+from load import frame_request, is_approved  # noqa: E402
+
+REQUEST = """<?xml version="1.0" ?>
+<TransactionEMV>
+  <MerchantTransactionID>{merchant_transaction_id}</MerchantTransactionID>
+  <ZRNumber>1</ZRNumber>
+  <DeviceNumber>1</DeviceNumber>
+  <DeviceType>1</DeviceType>
+  <TerminalID>T0000001</TerminalID>
+  <TransactionType>PURCHASE</TransactionType>
+  <TransactionAmount>4.00</TransactionAmount>
+  <CurrencyCode>EUR</CurrencyCode>
+  <TimeoutResponse>30</TimeoutResponse>
+</TransactionEMV>
+"""
+
+TAGS = DefaultTags(1, 1, 1, 1, "T0000001")
+CARD = {
+    'account_number': '**********1234',
+    'expiration_date': '2512',
+    'original_transaction_amount': 400,
+    'currency_code': 'EUR',
+}
+BATCH_SIZE = 100
+
+# name -> setup returning the function to time, a setup raises
+# SkipBenchmark (or ImportError) when a dependency is missing
+BENCHMARKS: dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+class SkipBenchmark(Exception):
+    pass
+
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+@benchmark("xml_parser.parse")
+def bench_parse():
+    xml = REQUEST.format(merchant_transaction_id=1)
+    return lambda: XMLParser.parse(xml)
+
+
+@benchmark("xml_parser.get_value")
+def bench_get_value():
+    parsed = XMLParser.parse(REQUEST.format(merchant_transaction_id=1))
+    return lambda: XMLParser.get_value(parsed, 'CurrencyCode')
+
+
+@benchmark("xml_parser.dict_to_xml")
+def bench_dict_to_xml():
+    message = MessageGenerator.get_transaction_emv_response_message(
+        TAGS, TransactionResponseCode.AUTHORISED, **CARD)
+    return lambda: XMLParser.dict_to_xml(message)
+
+
+@benchmark("xml_parser.dict_to_xml_fast")
+def bench_dict_to_xml_fast():
+    message = MessageGenerator.get_transaction_emv_response_message(
+        TAGS, TransactionResponseCode.AUTHORISED, **CARD)
+    return lambda: XMLParser.dict_to_xml_fast(message)
+
+
+@benchmark("request_types.parse_request")
+def bench_parse_request():
+    xml = REQUEST.format(merchant_transaction_id=1)
+    return lambda: parse_request(xml)
+
+
+@benchmark("message_generator.get_terminal_status_emv_message")
+def bench_terminal_status():
+    return lambda: MessageGenerator.get_terminal_status_emv_message(
+        TAGS, TerminalStatusResponseCode.IDLE)
+
+
+@benchmark("message_generator.get_terminal_message_emv_message")
+def bench_terminal_message():
+    return lambda: MessageGenerator.get_terminal_message_emv_message(
+        TAGS, TerminalMessageResponseCode.INFO, "Paper low")
+
+
+@benchmark("message_generator.get_terminal_display_emv_message")
+def bench_terminal_display():
+    return lambda: MessageGenerator.get_terminal_display_emv_message(
+        TAGS, "Insert card", 1, DisplayMessageLevel.INFO, "en")
+
+
+@benchmark("message_generator.get_transaction_emv_cancel_message")
+def bench_cancel():
+    return lambda: MessageGenerator.get_transaction_emv_cancel_message(
+        TAGS, TransactionCancelCode.Cancel_accepted)
+
+
+@benchmark("message_generator.get_transaction_emv_response_message")
+def bench_transaction():
+    return lambda: MessageGenerator.get_transaction_emv_response_message(
+        TAGS, TransactionResponseCode.AUTHORISED, **CARD)
+
+
+@benchmark("message_generator.get_transaction_emv_response_message.fixed_ids")
+def bench_transaction_fixed_ids():
+    time_tags = current_time_tags()
+    generated_ids = ("A" * 20, 10**19, "B" * 20)
+    return lambda: MessageGenerator.get_transaction_emv_response_message(
+        TAGS, TransactionResponseCode.AUTHORISED, time_tags=time_tags,
+        generated_ids=generated_ids, **CARD)
+
+
+@benchmark(f"message_generator.get_terminal_status_emv_messages.x{BATCH_SIZE}")
+def bench_terminal_status_batch():
+    tags = [TAGS] * BATCH_SIZE
+    codes = [TerminalStatusResponseCode.IDLE] * BATCH_SIZE
+    return lambda: MessageGenerator.get_terminal_status_emv_messages(tags, codes)
+
+
+@benchmark(f"message_generator.get_transaction_emv_response_messages.x{BATCH_SIZE}")
+def bench_transaction_batch():
+    tags = [TAGS] * BATCH_SIZE
+    codes = [TransactionResponseCode.AUTHORISED] * BATCH_SIZE
+    return lambda: MessageGenerator.get_transaction_emv_response_messages(
+        tags, codes, **CARD)
+
+
+@benchmark("server.frame_xml")
+def bench_frame():
+    from framing import frame_xml
+    xml = XMLParser.dict_to_xml(MessageGenerator.get_terminal_status_emv_message(
+        TAGS, TerminalStatusResponseCode.IDLE))
+    return lambda: frame_xml(xml)
+
+
+@benchmark("server.clean_xml")
+def bench_clean():
+    from server import ConnectionHandler
+    data = frame_request(REQUEST.format(merchant_transaction_id=1))
+    return lambda: ConnectionHandler.clean_xml(None, data.decode())
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def loopback(**config_overrides):
+    """TransactionEMV request to final response through a headless server
+    started on a free port with its own config."""
+    import yaml  # noqa: F401, the server needs it as well
+
+    port = free_port()
+    workdir = tempfile.mkdtemp(prefix="sbterminal-bench-")
+    os.makedirs(os.path.join(workdir, "data"))
+    with open(os.path.join(workdir, "data", "config.yaml"), "w") as file:
+        json.dump({'port': port, 'send_rsp_before_timeout': False,
+                   'duplicate_cache_ttl': 0, **config_overrides},
+                  file)  # JSON is valid YAML
+
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(SRC, "headless.py")], cwd=workdir,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    conn = None
+    deadline = time.monotonic() + 10
+    while conn is None:
+        if server.poll() is not None or time.monotonic() > deadline:
+            server.kill()
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise SkipBenchmark("headless server did not start")
+        try:
+            conn = socket.create_connection(("127.0.0.1", port), timeout=5)
+        except OSError:
+            time.sleep(0.1)
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    transaction_ids = iter(range(1, 10**9))
+    buffer = bytearray()
+
+    def round_trip():
+        merchant_transaction_id = next(transaction_ids)
+        conn.sendall(frame_request(REQUEST.format(
+            merchant_transaction_id=merchant_transaction_id)))
+        while True:
+            end = buffer.find(b"\x03")
+            if end < 0:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    raise ConnectionError("headless server closed the connection")
+                buffer.extend(chunk)
+                continue
+            frame = bytes(buffer[:end + 1])
+            del buffer[:end + 1]
+            if b"<TransactionEMV>" in frame:
+                if not is_approved(frame, merchant_transaction_id):
+                    raise RuntimeError(f"transaction not approved: {frame!r}")
+                return frame
+
+    def stop():
+        conn.close()
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    round_trip.stop = stop
+    return round_trip
+
+
+# the socket options of the accepted connection, one variant per option
+LOOPBACK_VARIANTS = {
+    "": {},
+    ".no_nodelay": {'tcp_nodelay': False},
+    ".no_keepalive": {'tcp_keepalive': False},
+    ".small_buffers": {'socket_send_buffer': 4096,
+                       'socket_receive_buffer': 4096},
+}
+for suffix, overrides in LOOPBACK_VARIANTS.items():
+    benchmark(f"headless.loopback_transaction{suffix}")(
+        functools.partial(loopback, **overrides))
+
+
+def serve_echo(sock: socket.socket):
+    """Echoes every connection accepted on `sock` on its own thread."""
+    def echo(conn: socket.socket):
+        with conn:
+            while data := conn.recv(65536):
+                conn.sendall(data)
+
+    def accept():
+        while True:
+            conn, _ = sock.accept()
+            threading.Thread(target=echo, args=(conn,), daemon=True).start()
+    threading.Thread(target=accept, daemon=True).start()
+
+
+@functools.cache
+def tls_fixture() -> dict:
+    """A plaintext TCP echo server, and the TLS proxy with a self-signed
+    certificate in front of a Unix socket echo server."""
+    from tls_proxy import TlsProxy, create_server_context
+
+    workdir = tempfile.mkdtemp(prefix="sbterminal-bench-tls-")
+    atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+    certificate = os.path.join(workdir, "certificate.pem")
+    private_key = os.path.join(workdir, "key.pem")
+    try:
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+             "-keyout", private_key, "-out", certificate, "-days", "1",
+             "-subj", "/CN=localhost"],
+            check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise SkipBenchmark(f"could not create a certificate with openssl: {e}")
+
+    plaintext = socket.create_server(("127.0.0.1", 0))
+    serve_echo(plaintext)
+    # the proxy removes the backend socket's directory on close
+    backend_path = os.path.join(tempfile.mkdtemp(dir=workdir), "backend.sock")
+    backend = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    backend.bind(backend_path)
+    backend.listen()
+    serve_echo(backend)
+
+    proxy = TlsProxy(0, backend_path,
+                     create_server_context(certificate, private_key, 2))
+    if not proxy.start():
+        raise SkipBenchmark("TLS proxy did not start")
+    atexit.register(proxy.close)
+
+    client_context = ssl.create_default_context(cafile=certificate)
+    client_context.check_hostname = False
+    return {
+        'plaintext_port': plaintext.getsockname()[1],
+        'tls_port': proxy.sock.getsockname()[1],
+        'client_context': client_context,
+    }
+
+
+MESSAGE = frame_request(REQUEST.format(merchant_transaction_id=1))
+
+
+def echo_round_trip(sock: socket.socket):
+    sock.sendall(MESSAGE)
+    received = 0
+    while received < len(MESSAGE):
+        received += len(sock.recv(65536))
+
+
+def connect_plaintext(fixture: dict) -> socket.socket:
+    sock = socket.create_connection(("127.0.0.1", fixture['plaintext_port']))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def connect_tls(fixture: dict, session=None) -> ssl.SSLSocket:
+    sock = socket.create_connection(("127.0.0.1", fixture['tls_port']))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return fixture['client_context'].wrap_socket(
+        sock, server_hostname="localhost", session=session)
+
+
+@benchmark("tls.connect.plaintext")
+def bench_connect_plaintext():
+    """Connect, one message round trip and close, the handshake benchmarks
+    below add TLS to the same sequence."""
+    fixture = tls_fixture()
+
+    def connect():
+        with connect_plaintext(fixture) as sock:
+            echo_round_trip(sock)
+    return connect
+
+
+@benchmark("tls.connect.full_handshake")
+def bench_connect_full_handshake():
+    fixture = tls_fixture()
+
+    def connect():
+        with connect_tls(fixture) as sock:
+            echo_round_trip(sock)
+    return connect
+
+
+@benchmark("tls.connect.resumed")
+def bench_connect_resumed():
+    fixture = tls_fixture()
+    # TLS 1.3 tickets arrive after the handshake, read before taking it
+    with connect_tls(fixture) as sock:
+        echo_round_trip(sock)
+        session = sock.session
+
+    def connect():
+        with connect_tls(fixture, session) as sock:
+            echo_round_trip(sock)
+            if not sock.session_reused:
+                raise SkipBenchmark("session was not resumed")
+    return connect
+
+
+@benchmark("tls.message.plaintext")
+def bench_message_plaintext():
+    sock = connect_plaintext(tls_fixture())
+    round_trip = functools.partial(echo_round_trip, sock)
+    round_trip.stop = sock.close
+    return round_trip
+
+
+@benchmark("tls.message.tls")
+def bench_message_tls():
+    sock = connect_tls(tls_fixture())
+    round_trip = functools.partial(echo_round_trip, sock)
+    round_trip.stop = sock.close
+    return round_trip
+
+
+def measure(function: Callable[[], object], repeat: int, min_time: float) -> float:
+    """Returns the best time per call in nanoseconds."""
+    timer = timeit.Timer(function)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best * 1e9 / number
+
+
+def run(args) -> int:
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if args.filter and args.filter not in name:
+            continue
+        try:
+            function = setup()
+        except (ImportError, SkipBenchmark) as e:
+            print(f"WARN: Skipping {name}: {e}")
+            continue
+        try:
+            ns = measure(function, args.repeat, args.min_time)
+        finally:
+            if hasattr(function, "stop"):
+                function.stop()
+        results[name] = {'ns_per_op': ns}
+        print(f"{name:<72} {ns / 1000:>12.2f} us")
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'benchmarks': results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    return 0
+
+
+def compare(args) -> int:
+    with open(args.baseline) as file:
+        baseline = json.load(file)['benchmarks']
+    with open(args.current) as file:
+        current = json.load(file)['benchmarks']
+
+    regressions = []
+    for name, result in current.items():
+        if name not in baseline:
+            print(f"{name:<72} {'new':>10}")
+            continue
+        ratio = result['ns_per_op'] / baseline[name]['ns_per_op']
+        marker = ""
+        if ratio > 1 + args.threshold:
+            regressions.append(name)
+            marker = "  REGRESSION"
+        print(f"{name:<72} {ratio:>9.2f}x{marker}")
+
+    for name in sorted(baseline.keys() - current.keys()):
+        print(f"{name:<72} {'missing':>10}")
+
+    if regressions:
+        print(f"ERROR: {len(regressions)} benchmark(s) regressed by more than "
+              f"{args.threshold:.0%}")
+        return 1
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--output", help="write results as JSON")
+    run_parser.add_argument("--filter", help="only run benchmarks whose name "
+                                             "contains this")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--min-time", type=float, default=0.2,
+                            help="seconds per timing run")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser(
+        "compare", help="fail when results regress against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="allowed slowdown, 0.1 is 10%%")
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
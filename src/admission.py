@@ -0,0 +1,131 @@
+import re
+import time
+
+from message_generator import DefaultTags, MessageGenerator, TransactionCancelCode, TransactionResponseCode
+from framing import frame_xml
+from terminal_config import Config
+from xml_parser import XMLParser
+
+
+class TokenBucket:
+    """Allows `rate` units per second with bursts of up to `burst`, a rate
+    of 0 never limits."""
+
+    def __init__(self, rate: float, burst: float = 0):
+        self.configure(rate, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def configure(self, rate: float, burst: float = 0):
+        self.rate = rate
+        self.burst = burst if burst > 0 else max(rate, 1)
+
+    def take(self, amount: float = 1) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+
+class AdmissionControl:
+    """Limits shared by every session of the process: inbound frames and
+    bytes per second, and the number of transactions waiting for an
+    answer."""
+
+    def __init__(self):
+        self.frames = TokenBucket(0)
+        self.bytes = TokenBucket(0)
+        self.max_in_flight = 0
+        self.in_flight = 0
+
+        self.rate_limited = 0
+        self.in_flight_rejected = 0
+        self.busy_replies = 0
+
+    def configure(self, config: Config):
+        self.frames.configure(config.global_frame_rate)
+        self.bytes.configure(config.global_byte_rate)
+        self.max_in_flight = config.max_in_flight_transactions
+
+    def admit(self, session_frames: TokenBucket, session_bytes: TokenBucket,
+              frames: int, size: int) -> bool:
+        if (session_frames.take(frames) and session_bytes.take(size)
+                and self.frames.take(frames) and self.bytes.take(size)):
+            return True
+        self.rate_limited += 1
+        return False
+
+    def acquire_in_flight(self) -> bool:
+        if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+            self.in_flight_rejected += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release_in_flight(self):
+        self.in_flight = max(0, self.in_flight - 1)
+
+    def metrics(self) -> dict:
+        return {
+            'in_flight': self.in_flight,
+            'rate_limited': self.rate_limited,
+            'in_flight_rejected': self.in_flight_rejected,
+            'busy_replies': self.busy_replies,
+        }
+
+
+admission = AdmissionControl()
+
+
+_ROOT_TAG = re.compile(r"<(TransactionEMV|TransactionCancelEMV)[\s>/]")
+_DEFAULT_TAG = re.compile(
+    r"<(MerchantTransactionID|ZRNumber|DeviceNumber|DeviceType|TerminalID)>"
+    r"\s*([0-9A-Za-z\-]{0,40})\s*</")
+_DEFAULT_TAG_ORDER = ('MerchantTransactionID', 'ZRNumber', 'DeviceNumber',
+                      'DeviceType', 'TerminalID')
+
+# rendered once with format fields in place of the default tags
+_busy_templates: dict[str, str] = {}
+
+
+def _busy_template(root_tag: str) -> str:
+    template = _busy_templates.get(root_tag)
+    if template is None:
+        placeholders = DefaultTags(*(f"{{{i}}}" for i in range(5)))
+        if root_tag == "TransactionCancelEMV":
+            message = MessageGenerator.get_transaction_emv_cancel_message(
+                placeholders, TransactionCancelCode.Terminal_busy)
+        else:
+            message = MessageGenerator.get_transaction_emv_response_message(
+                placeholders, TransactionResponseCode.Terminal_is_busy)
+        template = _busy_templates[root_tag] = frame_xml(
+            XMLParser.dict_to_xml(message)).decode()
+    return template
+
+
+def busy_reply(data: bytes, terminal_id: str = "") -> bytes:
+    """Terminal busy response echoing the request's default tags, found with
+    a regex instead of a full parse so floods stay cheap."""
+    text = data.decode("latin-1")
+    match = _ROOT_TAG.search(text)
+    tags = dict(_DEFAULT_TAG.findall(text))
+    if terminal_id:
+        tags['TerminalID'] = terminal_id
+    admission.busy_replies += 1
+    return _busy_template(match.group(1) if match else "TransactionEMV").format(
+        *(tags.get(tag, "0") for tag in _DEFAULT_TAG_ORDER)).encode()
+
+
+def busy_reply_for(default_tags: DefaultTags) -> bytes:
+    """Terminal busy TransactionEMV response for a parsed request."""
+    admission.busy_replies += 1
+    return _busy_template("TransactionEMV").format(
+        default_tags.merchant_transaction_id, default_tags.zr_number,
+        default_tags.device_number, default_tags.device_type,
+        default_tags.terminal_id).encode()
@@ -0,0 +1,45 @@
+from typing import Callable
+
+# ISO 4217 minor unit exponents, currencies not listed use two decimals
+CURRENCY_EXPONENTS = {
+    'BHD': 3, 'IQD': 3, 'JOD': 3, 'KWD': 3, 'LYD': 3, 'OMR': 3, 'TND': 3,
+    'BIF': 0, 'CLP': 0, 'DJF': 0, 'GNF': 0, 'ISK': 0, 'JPY': 0, 'KMF': 0,
+    'KRW': 0, 'PYG': 0, 'RWF': 0, 'UGX': 0, 'VND': 0, 'VUV': 0, 'XAF': 0,
+    'XOF': 0, 'XPF': 0,
+}
+DEFAULT_EXPONENT = 2
+
+
+def currency_exponent(currency_code: str) -> int:
+    return CURRENCY_EXPONENTS.get(currency_code, DEFAULT_EXPONENT)
+
+
+def make_formatter(exponent: int) -> Callable[[int], str]:
+    if exponent == 0:
+        return str
+    scale = 10 ** exponent
+
+    def format_minor(minor: int) -> str:
+        sign = "-" if minor < 0 else ""
+        major, fraction = divmod(abs(minor), scale)
+        return f"{sign}{major}.{fraction:0{exponent}d}"
+    return format_minor
+
+
+FORMATTERS = {exponent: make_formatter(exponent)
+              for exponent in {DEFAULT_EXPONENT, *CURRENCY_EXPONENTS.values()}}
+
+
+def parse_amount(text: str, currency_code: str) -> int:
+    """Parses a decimal amount like "4.00" into integer minor units,
+    raises ValueError when it has more decimals than the currency."""
+    exponent = currency_exponent(currency_code)
+    major, _, fraction = text.partition(".")
+    if len(fraction) > exponent:
+        raise ValueError(
+            f'"{text}" has more than {exponent} decimals for {currency_code}')
+    return int(major or "0") * 10 ** exponent + int(fraction.ljust(exponent, "0") or "0")
+
+
+def format_amount(minor: int, currency_code: str) -> str:
+    return FORMATTERS[currency_exponent(currency_code)](minor)
@@ -0,0 +1,73 @@
+import os
+import threading
+
+from PySide6.QtGui import QImage, QPixmap
+
+
+class PixmapCache:
+    """Decodes each image once and keeps pixmaps per requested size.
+
+    Images are decoded to QImage, which is safe off the GUI thread, so
+    `preload` can run on a worker thread. QPixmaps are only created on the
+    GUI thread in `pixmap`."""
+
+    def __init__(self, image_dir: str):
+        self.image_dir = image_dir
+        self.lock = threading.Lock()
+        self.paths: dict[str, str] = {}
+        self.images: dict[str, QImage] = {}
+        self.pixmaps: dict[tuple[str, int], QPixmap] = {}
+        self.preload_thread: threading.Thread | None = None
+
+    def image_path(self, name: str) -> str:
+        path = self.paths.get(name)
+        if path is None:
+            path = f'{self.image_dir}/{name}'
+            if not os.path.exists(path):
+                print(f"ERROR: {path} not found")
+                path = ''
+            self.paths[name] = path
+        return path
+
+    def image(self, name: str) -> QImage:
+        image = self.images.get(name)
+        if image is not None:
+            return image
+        # decoded outside the lock, when two threads race the first
+        # inserted image wins
+        image = QImage(self.image_path(name))
+        with self.lock:
+            return self.images.setdefault(name, image)
+
+    def pixmap(self, name: str, width: int = 0) -> QPixmap:
+        """Returns the image as a pixmap, scaled to `width` if non zero."""
+        key = (name, width)
+        pixmap = self.pixmaps.get(key)
+        if pixmap is None:
+            pixmap = QPixmap.fromImage(self.image(name))
+            if width and not pixmap.isNull():
+                pixmap = pixmap.scaledToWidth(width)
+            self.pixmaps[key] = pixmap
+        return pixmap
+
+    def preload(self):
+        """Decodes every image in the image directory on a worker thread."""
+        if self.preload_thread is not None:
+            return
+
+        def decode_all():
+            try:
+                names = sorted(os.listdir(self.image_dir))
+            except OSError as e:
+                print(f"ERROR: Could not preload images: {e}")
+                return
+            for name in names:
+                if name.endswith('.png'):
+                    self.image(name)
+
+        self.preload_thread = threading.Thread(
+            target=decode_all, name="PixmapPreload", daemon=True)
+        self.preload_thread.start()
+
+
+pixmap_cache = PixmapCache('assets/images')
@@ -0,0 +1,64 @@
+from collections import deque
+from dataclasses import dataclass
+
+from PySide6.QtCore import QObject, Signal
+
+from message_generator import DisplayMessageLevel, TerminalStatusResponseCode, TransactionResponseCode
+from terminal_config import CardProfile
+
+
+@dataclass(slots=True, frozen=True)
+class StatusCommand:
+    status_code: TerminalStatusResponseCode
+
+
+@dataclass(slots=True, frozen=True)
+class DisplayCommand:
+    text: str
+    message_code: int
+    message_level: DisplayMessageLevel
+
+
+@dataclass(slots=True, frozen=True)
+class TransactionCommand:
+    response_code: TransactionResponseCode
+    card: CardProfile | None
+
+
+Command = StatusCommand | DisplayCommand | TransactionCommand
+
+
+class CommandQueue(QObject):
+    """Bounded queue from the UI thread (the only producer) to the
+    connection handler (the only consumer). deque appends and pops are
+    atomic, so no lock is taken; `ready` is emitted only when the consumer
+    has no drain pending and is queued to the consumer's thread."""
+
+    ready = Signal()
+
+    def __init__(self, capacity: int = 256, parent=None):
+        super().__init__(parent)
+        self.capacity = capacity
+        self.commands: deque[Command] = deque()
+        self.wakeup_pending = False
+        self.dropped = 0
+
+    def put(self, command: Command) -> bool:
+        if len(self.commands) >= self.capacity:
+            self.dropped += 1
+            print(f"WARN: Command queue full, dropped {type(command).__name__}")
+            return False
+        self.commands.append(command)
+        if not self.wakeup_pending:
+            self.wakeup_pending = True
+            self.ready.emit()
+        return True
+
+    def drain(self) -> list[Command]:
+        # cleared before popping, a command put meanwhile either is in this
+        # batch or wakes the consumer again
+        self.wakeup_pending = False
+        batch = []
+        while self.commands:
+            batch.append(self.commands.popleft())
+        return batch
@@ -0,0 +1,4 @@
+def frame_xml(xml: str) -> bytes:
+    """STX/ETX frame of an outbound message. Qt free, so process pool workers
+    and benchmarks can import it."""
+    return f"\x02\n{xml}\x03".encode()
@@ -0,0 +1,151 @@
+import json
+import os
+import socket
+import threading
+from typing import Callable
+
+from PySide6.QtCore import QObject, Signal
+
+TAKEOVER_REQUEST = b"TAKEOVER"
+TAKEOVER_DONE = b"LISTENING"
+
+
+def unix_socket_in_use(path: str) -> bool:
+    """True when a process accepts connections on the Unix socket `path`."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def bind_unix_socket(path: str, backlog: int) -> socket.socket | None:
+    """Listening Unix socket at `path`, a stale socket file is replaced but
+    one still served by another process is left alone.
+
+    The socket is bound under a temporary name and moved into place, so
+    replacing the file is atomic and QLocalServer.close(), which removes the
+    bound name, leaves `path` to the process it was handed to."""
+    if unix_socket_in_use(path):
+        print(f"ERROR: \"{path}\" is served by another process")
+        return None
+
+    bound_path = f"{path}.{os.getpid()}.bind"
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        if os.path.exists(bound_path):
+            os.unlink(bound_path)
+        sock.bind(bound_path)
+        sock.listen(backlog)
+        os.replace(bound_path, path)
+    except OSError as e:
+        print(f"ERROR: Could not listen on \"{path}\": {e}")
+        sock.close()
+        return None
+    return sock
+
+
+def request_takeover(path: str) -> tuple[socket.socket, dict[str, int]] | None:
+    """Asks the process serving `path` for its listening sockets, returns the
+    connection and the received descriptors by key ("tcp:<port>",
+    "unix:<path>", "tls:<port>"), None when no process is serving it. Call
+    `confirm_takeover` once listening on them."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendall(TAKEOVER_REQUEST)
+        message, fds, _, _ = socket.recv_fds(sock, 65536, 64)
+    except OSError:
+        sock.close()
+        return None
+
+    keys = json.loads(message)
+    print(f"INFO: Took over listening sockets {keys}")
+    return sock, dict(zip(keys, fds))
+
+
+def confirm_takeover(sock: socket.socket):
+    try:
+        sock.sendall(TAKEOVER_DONE)
+    except OSError as e:
+        print(f"WARN: Could not confirm takeover: {e}")
+    sock.close()
+
+
+class HandoffServer(QObject):
+    """Hands the listening sockets to a new process connecting on a Unix
+    socket at `path` (SCM_RIGHTS). `taken_over` is emitted once the new
+    process listens on them, the kernel keeps queueing connections on the
+    shared sockets in the meantime so none are refused."""
+
+    taken_over = Signal()
+
+    def __init__(self, path: str, descriptors: Callable[[], dict[str, int]],
+                 confirm_timeout: float = 10.0, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.descriptors = descriptors
+        self.confirm_timeout = confirm_timeout
+        self.server: socket.socket | None = None
+
+    def start(self) -> bool:
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        try:
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.server.bind(self.path)
+            self.server.listen(1)
+        except OSError as e:
+            print(f"ERROR: Could not serve handoff on \"{self.path}\": {e}")
+            return False
+
+        threading.Thread(target=self.serve, daemon=True,
+                         name="HandoffServer").start()
+        print(f"INFO: Accepting handoff on \"{self.path}\"")
+        return True
+
+    def serve(self):
+        while self.server is not None:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return  # closed
+            with conn:
+                if self.hand_off(conn):
+                    self.close()
+                    self.taken_over.emit()
+                    return
+
+    def hand_off(self, conn: socket.socket) -> bool:
+        try:
+            if conn.recv(len(TAKEOVER_REQUEST)) != TAKEOVER_REQUEST:
+                return False
+            descriptors = self.descriptors()
+            socket.send_fds(conn, [json.dumps(list(descriptors)).encode()],
+                            list(descriptors.values()))
+            # keep serving until the new process is listening, if it dies
+            # before that nothing changed for the registers
+            conn.settimeout(self.confirm_timeout)
+            confirmed = conn.recv(len(TAKEOVER_DONE)) == TAKEOVER_DONE
+        except OSError as e:
+            print(f"WARN: Handoff failed: {e}")
+            return False
+        if not confirmed:
+            print("WARN: New process did not confirm the takeover")
+        return confirmed
+
+    def close(self):
+        server, self.server = self.server, None
+        if server is not None:
+            # the path is left in place, the new process binds it again.
+            # shutdown wakes up a thread blocked in accept
+            try:
+                server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            server.close()
@@ -0,0 +1,163 @@
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+
+from PySide6.QtCore import QCoreApplication, Qt, QTimer
+
+from terminal_config import get_config, get_terminal_profiles
+from server import TerminalListener, cancel_metrics
+from handoff import HandoffServer, confirm_takeover, request_takeover
+from admission import admission
+from outbound import derived_metrics, outbound_metrics
+from supervisor import METRICS_PREFIX, Supervisor
+
+
+def report_metrics(listeners: list[TerminalListener]) -> None:
+    totals: dict = {}
+    for listener in listeners:
+        for key, value in listener.metrics().items():
+            totals[key] = totals.get(key, 0) + value
+    totals.update(admission.metrics())
+    totals.update(outbound_metrics())
+    totals.update(cancel_metrics())
+    totals.update(derived_metrics(totals))
+    print(f"{METRICS_PREFIX}{json.dumps(totals)}", flush=True)
+
+
+def run_server(reuse_port: bool, metrics_interval: float,
+               handoff_path: str | None = None,
+               inherited: dict[str, int] | None = None) -> int:
+    app = QCoreApplication(sys.argv[:1])
+
+    takeover = request_takeover(handoff_path) if handoff_path else None
+    descriptors = dict(takeover[1]) if takeover else {}
+    descriptors.update(inherited or {})
+
+    listeners: list[TerminalListener] = []
+    failed: list[TerminalListener] = []
+    for profile in get_terminal_profiles(get_config()):
+        listener = TerminalListener(profile)
+        if listener.listen(reuse_port, descriptors, bool(inherited),
+                           handoff_path is not None):
+            listeners.append(listener)
+        else:
+            failed.append(listener)
+
+    for descriptor in descriptors.values():
+        os.close(descriptor)  # socket no longer configured
+    if takeover and failed:
+        # without the confirmation the old process keeps serving
+        print("ERROR: Could not listen on every socket taken over, "
+              "leaving them to the old process")
+        for listener in listeners + failed:
+            listener.handed_off()  # the socket files stay with the old process
+            listener.close()
+        takeover[0].close()
+        return 1
+    for listener in failed:
+        listener.close()
+    if takeover:
+        # the old process drains and exits from here on
+        confirm_takeover(takeover[0])
+
+    if not listeners:
+        print("ERROR: No terminal is listening, exiting")
+        return 1
+
+    print(f"INFO: Simulating {len(listeners)} terminal(s)")
+
+    drain_timer = QTimer()
+    drain_deadline = 0.0
+
+    def drain():
+        nonlocal drain_deadline
+        if drain_timer.isActive():
+            app.quit()  # second request, stop right away
+            return
+        drain_deadline = time.monotonic() + get_config().drain_timeout
+        drain_timer.start(100)
+        check_drained()
+
+    def check_drained():
+        for listener in listeners:
+            listener.drain()
+        if all(listener.drained() for listener in listeners):
+            print("INFO: All sessions drained")
+            app.quit()
+        elif time.monotonic() > drain_deadline:
+            print("WARN: Drain timeout, closing remaining sessions")
+            app.quit()
+
+    drain_timer.timeout.connect(check_drained)
+
+    def taken_over():
+        for listener in listeners:
+            listener.handed_off()
+        drain()
+
+    handoff_server = None
+    if handoff_path:
+        handoff_server = HandoffServer(
+            handoff_path,
+            lambda: {key: descriptor for listener in listeners
+                     for key, descriptor in listener.socket_descriptors().items()})
+        # emitted on the handoff thread, the drain timers belong to this one
+        handoff_server.taken_over.connect(
+            taken_over, Qt.ConnectionType.QueuedConnection)
+        handoff_server.start()
+
+    # Python signal handlers only run while the interpreter is active,
+    # wake it up periodically so Ctrl+C works inside the Qt event loop
+    signal.signal(signal.SIGINT, lambda *_: app.quit())
+    signal.signal(signal.SIGTERM, lambda *_: drain())
+    wakeup_timer = QTimer()
+    wakeup_timer.timeout.connect(lambda: None)
+    wakeup_timer.start(200)
+
+    metrics_timer = QTimer()
+    if metrics_interval > 0:
+        metrics_timer.timeout.connect(lambda: report_metrics(listeners))
+        metrics_timer.start(int(metrics_interval * 1000))
+
+    app.exec()
+
+    if handoff_server:
+        handoff_server.close()
+    for listener in listeners:
+        listener.close()
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=0,
+                        help="run N worker processes sharing the ports "
+                             "through SO_REUSEPORT")
+    parser.add_argument("--reuse-port", action="store_true",
+                        help="bind the ports with SO_REUSEPORT")
+    parser.add_argument("--metrics-interval", type=float, default=0,
+                        help="print metrics every N seconds")
+    parser.add_argument("--handoff", metavar="PATH",
+                        help="take over the listening sockets of the process "
+                             "serving this Unix socket, then serve it for the "
+                             "next restart")
+    parser.add_argument("--inherit", metavar="JSON", type=json.loads,
+                        help=argparse.SUPPRESS)  # sockets from the supervisor
+    args = parser.parse_args()
+
+    if args.workers > 0:
+        supervisor = Supervisor(args.workers, args.metrics_interval or 5.0)
+        signal.signal(signal.SIGINT, lambda *_: supervisor.stop())
+        signal.signal(signal.SIGTERM, lambda *_: supervisor.stop())
+        supervisor.run()
+        return 0
+
+    return run_server(args.reuse_port, args.metrics_interval, args.handoff,
+                      args.inherit)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
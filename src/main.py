@@ -1,19 +1,49 @@
-from terminal_config import config
+import time
+
+START_TIME = time.perf_counter()
+
+import argparse
+import sys
+
+from terminal_config import store
+from asset_cache import pixmap_cache
 from ui import MainWindow
 
 from PySide6.QtWidgets import QApplication
 
 
+def report_first_paint(window: MainWindow, exit_after_first_paint: bool) -> None:
+    elapsed_ms = (time.perf_counter() - START_TIME) * 1000
+    print(f"INFO: First paint after {elapsed_ms:.1f} ms", flush=True)
+    if exit_after_first_paint:
+        window.close()
+
+
 def main() -> None:
-    global config
-    app = QApplication([])
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exit-after-first-paint", action="store_true",
+                        help="quit once the idle screen is painted, used by "
+                             "benchmarks/startup.py")
+    args, qt_args = parser.parse_known_args()
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    pixmap_cache.preload()
 
     window = MainWindow()
+    window.first_painted.connect(
+        lambda: report_first_paint(window, args.exit_after_first_paint))
 
     window.show()
 
+    # the watcher thread hands reloads to the GUI thread through a signal
+    store.add_listener(lambda _: window.config_reloaded.emit())
+    store.watch()
+
     app.exec()
 
+    store.stop_watching()
+    store.flush()
+
 
 if __name__ == "__main__":
     main()
@@ -1,12 +1,16 @@
 from dataclasses import dataclass
 from datetime import datetime, timezone, timedelta
 from enum import Enum
+from typing import Iterable, Sequence
 import string
 import secrets
 import random
 
+from amounts import format_amount
+from xml_parser import XMLParser
 
-@dataclass
+
+@dataclass(slots=True, frozen=True)
 class DefaultTags:
     merchant_transaction_id: int
     zr_number: int
@@ -217,17 +221,64 @@ def generate_random_an_string(length=20):
     return ''.join(secrets.choice(characters) for _ in range(length))
 
 
+_AN_CHARACTERS = string.ascii_letters + string.digits
+# bytes >= 248 are dropped so every character stays equally likely
+_AN_TRANSLATION = bytes(ord(_AN_CHARACTERS[b % 62]) for b in range(256))
+_AN_REJECTED = bytes(range(248, 256))
+
+
+def generate_random_an_strings(count: int, length=20) -> list[str]:
+    """Bulk variant of generate_random_an_string."""
+    needed = count * length
+    raw = b""
+    while len(raw) < needed:
+        raw += secrets.token_bytes(needed - len(raw) + 16).translate(
+            None, _AN_REJECTED)
+    chars = raw[:needed].translate(_AN_TRANSLATION).decode("ascii")
+    return [chars[i:i + length] for i in range(0, needed, length)]
+
+
+def current_time_tags() -> tuple[str, str, str]:
+    """Returns the (date, time, time offset) tag values for now."""
+    utc_offset = timedelta(hours=1)
+    now = datetime.now(timezone.utc) + utc_offset
+    date_str = now.strftime('%d%m%y')
+    time_str = now.strftime('%H%M%S')
+    time_offset_str = f"UTC+{utc_offset.total_seconds() // 3600:.0f}"
+    return date_str, time_str, time_offset_str
+
+
+def frame_messages(xml_messages: Iterable[str], as_views: bool = False) -> bytes | list[memoryview]:
+    """Frames each message with STX/ETX into one contiguous buffer,
+    optionally returned as one memoryview per message."""
+    frames = [f"\x02\n{xml}\x03" for xml in xml_messages]
+    text = "".join(frames)
+    buffer = text.encode()
+    if not as_views:
+        return buffer
+
+    if len(buffer) == len(text):  # ASCII only, string lengths are offsets
+        lengths = [len(frame) for frame in frames]
+    else:
+        lengths = [len(frame.encode()) for frame in frames]
+
+    view = memoryview(buffer)
+    views = []
+    offset = 0
+    for length in lengths:
+        views.append(view[offset:offset + length])
+        offset += length
+    return views
+
+
 class MessageGenerator:
     @staticmethod
     def get_terminal_status_emv_message(
         default_tags: DefaultTags,
-        status_code: TerminalStatusResponseCode
+        status_code: TerminalStatusResponseCode,
+        time_tags: tuple[str, str, str] | None = None
     ) -> dict:
-        utc_offset = timedelta(hours=1)
-        now = datetime.now(timezone.utc) + utc_offset
-        date_str = now.strftime('%d%m%y')
-        time_str = now.strftime('%H%M%S')
-        time_offset_str = f"UTC+{utc_offset.total_seconds() // 3600:.0f}"
+        date_str, time_str, time_offset_str = time_tags or current_time_tags()
         return {
             'TerminalStatusEMV': {
                 # default tags
@@ -333,16 +384,21 @@ class MessageGenerator:
         card_issuer: CardIssuerCode = CardIssuerCode.NONE,
         card_type: CardType = CardType.NONE,
         # unaltered_track_data: str = '',
-        original_transaction_amount: float = 0.0,
+        # amounts in minor units of currency_code
+        original_transaction_amount: int = 0,
         currency_code: str = '',
-        surcharge_amount: float = 0.0,
-        discount_amount: float = 0.0
+        surcharge_amount: int = 0,
+        discount_amount: int = 0,
+        time_tags: tuple[str, str, str] | None = None,
+        # (ApprovalCode, TransactionIdentifier, BarchID)
+        generated_ids: tuple[str, int, str] | None = None
     ) -> dict:
-        utc_offset = timedelta(hours=1)
-        now = datetime.now(timezone.utc) + utc_offset
-        date_str = now.strftime('%d%m%y')
-        time_str = now.strftime('%H%M%S')
-        time_offset_str = f"UTC+{utc_offset.total_seconds() // 3600:.0f}"
+        date_str, time_str, time_offset_str = time_tags or current_time_tags()
+        if generated_ids is None and getTransactionResponseStatusFromCode(
+                response_code.value) == "AUTHORIZED":
+            generated_ids = (generate_random_an_string(20),
+                             random.randint(10**19, 10**20 - 1),
+                             generate_random_an_string(20))
         is_authorized = getTransactionResponseStatusFromCode(
             response_code.value) == "AUTHORIZED"
         return {
@@ -374,17 +430,17 @@ class MessageGenerator:
                 'ResponseTextMessage': response_code._name_.replace("_", " "),
 
                 # transaction tags
-                **({'OriginalTransactionAmount': original_transaction_amount}
-                        if surcharge_amount != 0.0
-                        or discount_amount != 0.0 else {}),
-                **({'TransactionAmount': original_transaction_amount + surcharge_amount - discount_amount}
+                **({'OriginalTransactionAmount': format_amount(original_transaction_amount, currency_code)}
+                        if surcharge_amount != 0
+                        or discount_amount != 0 else {}),
+                **({'TransactionAmount': format_amount(original_transaction_amount + surcharge_amount - discount_amount, currency_code)}
                    if is_authorized else {}),
-                **({'SurchargeAmount': surcharge_amount}
-                        if surcharge_amount != 0.0 else {}),
-                **({'DiscountAmount': discount_amount}
-                        if discount_amount != 0.0 else {}),
+                **({'SurchargeAmount': format_amount(surcharge_amount, currency_code)}
+                        if surcharge_amount != 0 else {}),
+                **({'DiscountAmount': format_amount(discount_amount, currency_code)}
+                        if discount_amount != 0 else {}),
                 # 'CardAmount': '0.00'
-                **({'ApprovalCode': generate_random_an_string(20)}
+                **({'ApprovalCode': generated_ids[0]}
                    if is_authorized else {}),
                 **({'TransactionDate': date_str}
                    if is_authorized else {}),
@@ -392,7 +448,7 @@ class MessageGenerator:
                    if is_authorized else {}),
                 **({'TransactionTimeOffset': time_offset_str}
                    if is_authorized else {}),
-                **({'TransactionIdentifier': random.randint(10**19, 10**20 - 1)}
+                **({'TransactionIdentifier': generated_ids[1]}
                    if is_authorized else {}),
                 # TODO: generate receipts
                 **({'MerchantReceipt': 'asdasd'}
@@ -401,7 +457,51 @@ class MessageGenerator:
                    if is_authorized else {}),
                 **({'CurrencyCode': currency_code}
                    if is_authorized else {}),
-                **({'BarchID': generate_random_an_string(20)}
+                **({'BarchID': generated_ids[2]}
                    if is_authorized else {})
             }
         }
+
+    @staticmethod
+    def get_terminal_status_emv_messages(
+        default_tags: Sequence[DefaultTags],
+        status_codes: Sequence[TerminalStatusResponseCode],
+        as_views: bool = False
+    ) -> bytes | list[memoryview]:
+        """Batch variant of get_terminal_status_emv_message, returns the
+        serialized and framed messages in one buffer."""
+        time_tags = current_time_tags()
+        return frame_messages(
+            (XMLParser.dict_to_xml_fast(
+                MessageGenerator.get_terminal_status_emv_message(
+                    tags, status_code, time_tags))
+             for tags, status_code in zip(default_tags, status_codes, strict=True)),
+            as_views
+        )
+
+    @staticmethod
+    def get_transaction_emv_response_messages(
+        default_tags: Sequence[DefaultTags],
+        response_codes: Sequence[TransactionResponseCode],
+        as_views: bool = False,
+        **kwargs
+    ) -> bytes | list[memoryview]:
+        """Batch variant of get_transaction_emv_response_message, `kwargs`
+        are passed to every message."""
+        count = len(response_codes)
+        time_tags = current_time_tags()
+        random_strings = generate_random_an_strings(count * 2, 20)
+        identifiers = [random.randint(10**19, 10**20 - 1) for _ in range(count)]
+        return frame_messages(
+            (XMLParser.dict_to_xml_fast(
+                MessageGenerator.get_transaction_emv_response_message(
+                    tags, response_code,
+                    time_tags=time_tags,
+                    generated_ids=(random_strings[2 * i],
+                                   identifiers[i],
+                                   random_strings[2 * i + 1]),
+                    **kwargs))
+             for i, (tags, response_code)
+             in enumerate(zip(default_tags, response_codes, strict=True))),
+            as_views
+        )
@@ -0,0 +1,157 @@
+import socket
+import struct
+import threading
+
+from PySide6.QtCore import QObject, Signal
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+SIOCGIFADDR = 0x8915
+
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+
+
+def default_route_interface() -> str | None:
+    """Returns the interface of the IPv4 default route from /proc/net/route."""
+    try:
+        with open("/proc/net/route") as file:
+            next(file)  # header
+            for line in file:
+                columns = line.split()
+                # destination 0.0.0.0 with the RTF_UP flag set
+                if columns[1] == "00000000" and int(columns[3], 16) & 0x1:
+                    return columns[0]
+    except (OSError, StopIteration, IndexError, ValueError):
+        pass
+    return None
+
+
+def interface_address(interface: str) -> str | None:
+    if fcntl is None:
+        return None
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try:
+            request = struct.pack("256s", interface[:15].encode())
+            response = fcntl.ioctl(s.fileno(), SIOCGIFADDR, request)
+        except OSError:
+            return None
+    return socket.inet_ntoa(response[20:24])
+
+
+def routed_address() -> str:
+    """Asks the kernel which address would be used to reach the internet,
+    a UDP connect sends no packets."""
+    ip = ""
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(("8.8.8.8", 80))
+        ip = s.getsockname()[0]
+        s.close()
+    except Exception as e:
+        print(f"WARNING: Could not determine device IP address: {e}")
+    return ip
+
+
+def resolve_local_ip() -> str:
+    interface = default_route_interface()
+    if interface is not None:
+        ip = interface_address(interface)
+        if ip:
+            return ip
+
+    # no default route, use the first configured non loopback interface
+    if fcntl is not None:
+        for _, name in socket.if_nameindex():
+            if name == "lo":
+                continue
+            ip = interface_address(name)
+            if ip:
+                return ip
+
+    return routed_address()
+
+
+class IpResolver(QObject):
+    """Resolves the device IP address on a background thread and resolves
+    it again when the kernel reports address or route changes."""
+
+    ip_changed = Signal(str)
+
+    def __init__(self, poll_interval: float = 5.0):
+        super().__init__()
+        self.ip: str = ""
+        self.poll_interval = poll_interval
+        self.resolved = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread: threading.Thread | None = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(
+            target=self.run, name="IpResolver", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def refresh(self):
+        ip = resolve_local_ip()
+        if ip != self.ip:
+            self.ip = ip
+            print(f"INFO: Device IP address is {ip or 'unknown'}")
+            self.ip_changed.emit(ip)
+        self.resolved.set()
+
+    def open_netlink(self) -> socket.socket | None:
+        if not hasattr(socket, "AF_NETLINK"):
+            return None
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                 socket.NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE))
+        except OSError as e:
+            print(f"WARNING: Netlink unavailable, polling for IP changes: {e}")
+            return None
+        sock.settimeout(self.poll_interval)
+        return sock
+
+    def run(self):
+        self.refresh()
+
+        sock = self.open_netlink()
+        while not self.stop_event.is_set():
+            if sock is None:
+                self.stop_event.wait(self.poll_interval)
+                self.refresh()
+                continue
+
+            try:
+                sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                sock.close()
+                sock = None
+                continue
+
+            # drain the burst of messages one change usually produces
+            sock.setblocking(False)
+            try:
+                while sock.recv(65536):
+                    pass
+            except (BlockingIOError, OSError):
+                pass
+            sock.settimeout(self.poll_interval)
+            self.refresh()
+
+        if sock is not None:
+            sock.close()
+
+
+ip_resolver = IpResolver()
@@ -0,0 +1,107 @@
+import time
+from collections import deque
+from enum import IntEnum
+
+from PySide6.QtNetwork import QLocalSocket, QTcpSocket
+
+
+class Priority(IntEnum):
+    CONTROL = 0
+    RESPONSE = 1
+    BULK = 2
+
+
+# message type -> (priority, deadline in seconds from queueing to the write)
+MESSAGE_CLASSES: dict[str, tuple[Priority, float | None]] = {
+    # the idle message timer fires 2 s before the register's timeout
+    'idle': (Priority.CONTROL, 2.0),
+    # the cancellation response follows 500 ms after the approval
+    'cancel': (Priority.CONTROL, 0.5),
+    'busy': (Priority.CONTROL, 0.5),
+    'transaction': (Priority.RESPONSE, None),
+    'reject': (Priority.RESPONSE, None),
+    'status': (Priority.BULK, None),
+    'display': (Priority.BULK, None),
+}
+
+# messages are held back while the socket has this much unwritten data so
+# later control messages can still overtake them
+HIGH_WATERMARK = 16 * 1024
+
+# per message type over all connections of the process
+stats: dict[str, dict[str, int]] = {}
+
+
+def outbound_metrics() -> dict:
+    """Raw counters, they are summed over worker processes (supervisor.py)
+    before derived_metrics computes the miss rates."""
+    metrics: dict = {}
+    for message_type, counters in stats.items():
+        metrics[f"outbound_{message_type}_sent"] = counters['sent']
+        metrics[f"outbound_{message_type}_deadline_missed"] = counters['missed']
+    return metrics
+
+
+# suffixes of the keys computed by derived_metrics, never summed
+DERIVED_SUFFIXES = ("_miss_rate", "_avg_ms")
+
+
+def derived_metrics(totals: dict) -> dict:
+    """Miss rates and averages computed from the raw counters in `totals`,
+    once they are summed over listeners or worker processes."""
+    derived: dict = {}
+    for key in [key for key in totals if key.startswith("outbound_")
+                and key.endswith("_sent")]:
+        prefix = key[:-len("_sent")]
+        sent = totals[key]
+        derived[f"{prefix}_miss_rate"] = (
+            totals.get(f"{prefix}_deadline_missed", 0) / sent if sent else 0.0)
+    if 'cancels' in totals:
+        derived['cancel_latency_avg_ms'] = (
+            totals.get('cancel_latency_total_ms', 0) / totals['cancels']
+            if totals['cancels'] else 0.0)
+    return derived
+
+
+class OutboundScheduler:
+    """Per connection queue of outbound frames, one FIFO per priority.
+    Frames are written to the socket highest priority first while it has
+    room, so keepalives and cancellations are not stuck behind transaction
+    responses and scenario traffic."""
+
+    def __init__(self):
+        self.queues: list[deque] = [deque() for _ in Priority]
+        self.conn: QTcpSocket | QLocalSocket | None = None
+
+    def attach(self, conn: QTcpSocket | QLocalSocket):
+        self.conn = conn
+        conn.bytesWritten.connect(self.flush)
+
+    def send(self, data: bytes, message_type: str):
+        priority, deadline = MESSAGE_CLASSES[message_type]
+        self.queues[priority].append((
+            data, message_type,
+            time.monotonic() + deadline if deadline is not None else None))
+        self.flush()
+
+    def flush(self, *_, force: bool = False):
+        while self.conn is not None and (
+                force or self.conn.bytesToWrite() < HIGH_WATERMARK):
+            queue = next((queue for queue in self.queues if queue), None)
+            if queue is None:
+                return
+            data, message_type, deadline = queue.popleft()
+            counters = stats.setdefault(message_type, {'sent': 0, 'missed': 0})
+            counters['sent'] += 1
+            if deadline is not None and time.monotonic() > deadline:
+                counters['missed'] += 1
+                print(f"WARN: {message_type} message missed its deadline")
+            self.conn.write(data)
+
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self.queues)
+
+    def clear(self):
+        for queue in self.queues:
+            queue.clear()
+        self.conn = None
@@ -0,0 +1,150 @@
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from typing import Callable
+
+from amounts import parse_amount
+from message_generator import DefaultTags
+
+
+@dataclass(slots=True, frozen=True)
+class TransactionRequest:
+    default_tags: DefaultTags
+    transaction_type: str
+    transaction_amount: int  # minor units of currency_code
+    currency_code: str
+    timeout_response: int
+
+
+@dataclass(slots=True, frozen=True)
+class TransactionCancelRequest:
+    default_tags: DefaultTags
+    timeout_response: int
+
+
+@dataclass(slots=True, frozen=True)
+class InvalidRequest:
+    """A request that failed validation, `tag` is None when the message
+    could not be parsed at all."""
+    tag: str | None
+    default_tags: DefaultTags
+    errors: tuple[str, ...]
+
+
+Request = TransactionRequest | TransactionCancelRequest
+
+
+@dataclass(slots=True, frozen=True)
+class Field:
+    name: str
+    convert: Callable[[str], object]
+    default: object = None  # None marks the tag as required
+
+
+def matching(pattern: str, convert: Callable[[str], object] = str) -> Callable[[str], object]:
+    compiled = re.compile(pattern)
+
+    def check(text: str):
+        if compiled.fullmatch(text) is None:
+            raise ValueError(f'"{text}" does not match {pattern}')
+        return convert(text)
+    return check
+
+
+NUMBER = matching(r"\d{1,10}", int)
+# echoed back unchanged, int() would strip leading zeros
+DIGITS = matching(r"\d{1,10}")
+IDENTIFIER = matching(r"[0-9A-Za-z\-]{1,40}")
+
+# the idle message is sent 2 s before the timeout and QTimer intervals are
+# 32 bit milliseconds
+MIN_TIMEOUT_RESPONSE = 3
+MAX_TIMEOUT_RESPONSE = 3600
+
+
+def timeout_seconds(text: str) -> int:
+    """TimeoutResponse in seconds, 0 means no timeout."""
+    value = NUMBER(text)
+    if value != 0 and not MIN_TIMEOUT_RESPONSE <= value <= MAX_TIMEOUT_RESPONSE:
+        raise ValueError(f"{value} is not 0 or within "
+                         f"{MIN_TIMEOUT_RESPONSE}..{MAX_TIMEOUT_RESPONSE}")
+    return value
+
+
+DEFAULT_TAGS_SCHEMA = {
+    'MerchantTransactionID': Field('merchant_transaction_id', IDENTIFIER),
+    'ZRNumber': Field('zr_number', DIGITS, 0),
+    'DeviceNumber': Field('device_number', DIGITS, 0),
+    'DeviceType': Field('device_type', DIGITS, 0),
+    'TerminalID': Field('terminal_id', matching(r"[0-9A-Za-z\-]{0,40}"), ""),
+}
+
+# per message type: tag -> field, unknown tags are ignored
+SCHEMAS: dict[str, tuple[type, dict[str, Field]]] = {
+    'TransactionEMV': (TransactionRequest, {
+        'TransactionType': Field('transaction_type', matching(r"[A-Za-z_]{1,20}"), ""),
+        'TransactionAmount': Field('transaction_amount', matching(r"\d{1,10}(\.\d{1,3})?")),
+        'CurrencyCode': Field('currency_code', matching(r"[A-Z]{3}")),
+        'TimeoutResponse': Field('timeout_response', timeout_seconds, 0),
+    }),
+    'TransactionCancelEMV': (TransactionCancelRequest, {
+        'TimeoutResponse': Field('timeout_response', timeout_seconds, 0),
+    }),
+}
+
+EMPTY_DEFAULT_TAGS = DefaultTags(
+    merchant_transaction_id=0,
+    zr_number=0,
+    device_number=0,
+    device_type=0,
+    terminal_id="",
+)
+
+
+def parse_request(xml_string: str) -> Request | InvalidRequest:
+    """Parses and validates an ECR request in one pass over its tags."""
+    try:
+        root = ET.fromstring(xml_string)
+    except ET.ParseError as e:
+        return InvalidRequest(None, EMPTY_DEFAULT_TAGS, (f"malformed XML: {e}",))
+
+    record, schema = SCHEMAS.get(root.tag, (None, {}))
+    tag_values = {}
+    values = {}
+    errors = []
+    for child in root:
+        field = DEFAULT_TAGS_SCHEMA.get(child.tag) or schema.get(child.tag)
+        if field is None:
+            continue
+        found = tag_values if child.tag in DEFAULT_TAGS_SCHEMA else values
+        try:
+            found[field.name] = field.convert(
+                child.text.strip() if child.text else "")
+        except ValueError as e:
+            errors.append(f"{child.tag}: {e}")
+            found[field.name] = 0 if field.default is None else field.default
+
+    for fields, found in ((DEFAULT_TAGS_SCHEMA, tag_values), (schema, values)):
+        for tag, field in fields.items():
+            if field.name in found:
+                continue
+            if field.default is None:
+                errors.append(f"{tag}: missing")
+                found[field.name] = 0
+            else:
+                found[field.name] = field.default
+
+    if record is TransactionRequest and not errors:
+        try:
+            values['transaction_amount'] = parse_amount(
+                values['transaction_amount'], values['currency_code'])
+        except ValueError as e:
+            errors.append(f"TransactionAmount: {e}")
+
+    default_tags = DefaultTags(**tag_values)
+    if record is None:
+        return InvalidRequest(root.tag, default_tags,
+                              (f'unsupported request "{root.tag}"',))
+    if errors:
+        return InvalidRequest(root.tag, default_tags, tuple(errors))
+    return record(default_tags=default_tags, **values)
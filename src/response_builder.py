@@ -0,0 +1,98 @@
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable
+
+from PySide6.QtCore import QObject, Signal, Slot
+
+from xml_parser import XMLParser
+from framing import frame_xml
+from message_generator import MessageGenerator
+
+executor: Executor | None = None
+
+
+def get_executor(workers: int, mode: str) -> Executor | None:
+    """Returns the pool shared by all sessions, None builds inline."""
+    global executor
+    if workers <= 0:
+        return None
+    if executor is None:
+        if mode == "process":
+            executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="ResponseBuilder")
+    return executor
+
+
+# build functions run in the pool, they are module level so a process pool
+# can pickle them
+
+def build_transaction_response(kwargs: dict) -> bytes:
+    return frame_xml(XMLParser.dict_to_xml(
+        MessageGenerator.get_transaction_emv_response_message(**kwargs)))
+
+
+class ResponseBuilder(QObject):
+    """Runs response builds on the executor and delivers the bytes back on
+    the owner's thread in submission order, whatever order they finish in."""
+
+    built = Signal(int, object)
+
+    def __init__(self, executor: Executor | None, parent: QObject | None = None):
+        super().__init__(parent)
+        self.executor = executor
+        self.next_sequence = 0
+        self.next_delivery = 0
+        self.callbacks: dict[int, Callable[[bytes], None]] = {}
+        self.finished: dict[int, bytes | None] = {}
+        # queued, the done callback fires on a pool thread
+        self.built.connect(self.on_built)
+
+    def submit(self, build: Callable, args, deliver: Callable[[bytes], None]):
+        sequence = self.next_sequence
+        self.next_sequence += 1
+        self.callbacks[sequence] = deliver
+
+        if self.executor is None:
+            self.finish(sequence, build(args))
+            return
+
+        future = self.executor.submit(build, args)
+        future.add_done_callback(
+            lambda future, sequence=sequence: self.built.emit(sequence, future))
+
+    def submit_ready(self, data: bytes, deliver: Callable[[bytes], None]):
+        """Queues already built bytes behind the builds still in flight."""
+        sequence = self.next_sequence
+        self.next_sequence += 1
+        self.callbacks[sequence] = deliver
+        self.finish(sequence, data)
+
+    def pending(self) -> int:
+        return len(self.callbacks)
+
+    @Slot(int, object)
+    def on_built(self, sequence: int, future: Future):
+        try:
+            data = future.result()
+        except Exception as e:
+            print(f"ERROR: Failed to build response {sequence}: {e}")
+            data = None
+        self.finish(sequence, data)
+
+    def finish(self, sequence: int, data: bytes | None):
+        if sequence not in self.callbacks:
+            return  # cleared while building
+        self.finished[sequence] = data
+        while self.next_delivery in self.finished:
+            data = self.finished.pop(self.next_delivery)
+            deliver = self.callbacks.pop(self.next_delivery)
+            self.next_delivery += 1
+            if data is not None:
+                deliver(data)
+
+    def clear(self):
+        """Drops every build that has not been delivered yet."""
+        self.callbacks.clear()
+        self.finished.clear()
+        self.next_delivery = self.next_sequence
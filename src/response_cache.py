@@ -0,0 +1,91 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class CachedResponse:
+    request: object
+    response: bytes
+    stored_at: float
+    size: int
+
+
+class ResponseCache:
+    """Bounded LRU cache of serialized responses keyed by
+    (TerminalID, MerchantTransactionID), entries expire after `ttl` seconds."""
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[tuple, CachedResponse] = OrderedDict()
+        self.size_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: tuple, request: object) -> bytes | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if time.monotonic() - entry.stored_at > self.ttl:
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        # same MerchantTransactionID with a different body is a new request
+        if entry.request != request:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry.response
+
+    def put(self, key: tuple, request: object, response: bytes):
+        if key in self.entries:
+            self._remove(key)
+
+        size = len(response) + len(repr(request))
+        if self.ttl <= 0 or size > self.max_bytes:
+            return
+
+        self.entries[key] = CachedResponse(
+            request=request,
+            response=response,
+            stored_at=time.monotonic(),
+            size=size
+        )
+        self.size_bytes += size
+
+        while (len(self.entries) > self.max_entries
+               or self.size_bytes > self.max_bytes):
+            oldest_key = next(iter(self.entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.size_bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'size_bytes': self.size_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def _remove(self, key: tuple):
+        entry = self.entries.pop(key)
+        self.size_bytes -= entry.size
@@ -1,50 +1,211 @@
-from PySide6.QtCore import QThread, Signal, QObject, QTimer, Slot
-from PySide6.QtNetwork import QAbstractSocket, QTcpServer, QHostAddress, QTcpSocket
+from PySide6.QtCore import QThread, Signal, QObject, QTimer, Slot, Qt
+from PySide6.QtNetwork import QAbstractSocket, QLocalServer, QLocalSocket, QTcpServer, QHostAddress, QTcpSocket
 import time
 import socket
 import functools
+import dataclasses
+import os
+import shutil
+import ssl
+import tempfile
+from typing import Callable
 
 from xml_parser import XMLParser
-from terminal_config import config
+from amounts import format_amount
+from terminal_config import CardProfile, Config, TerminalProfile, get_config
+from request_types import EMPTY_DEFAULT_TAGS, SCHEMAS, InvalidRequest, TransactionCancelRequest, TransactionRequest, parse_request
+from response_cache import ResponseCache
+from response_builder import ResponseBuilder, build_transaction_response, frame_xml, get_executor
+from net_info import ip_resolver
+from tls_proxy import TlsProxy, create_server_context
+from handoff import bind_unix_socket, unix_socket_in_use
+from admission import TokenBucket, admission, busy_reply, busy_reply_for
+from outbound import MESSAGE_CLASSES, OutboundScheduler, Priority
+from commands import CommandQueue, DisplayCommand, StatusCommand, TransactionCommand
 from message_generator import CardIssuerCode, MessageGenerator, DefaultTags, TerminalMessageResponseCode, TerminalStatusResponseCode, TransactionResponseCode, CardType, DisplayMessageLevel, TransactionCancelCode
 
-price: str
-currency_code: str
 
-default_tags: DefaultTags
+# cancellation request to final TransactionEMV response, over all sessions
+cancel_stats = {'cancels': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+
+
+def cancel_metrics() -> dict:
+    return {
+        'cancels': cancel_stats['cancels'],
+        'cancel_latency_total_ms': cancel_stats['total_ms'],
+        'cancel_latency_max_ms': cancel_stats['max_ms'],
+    }
+
+
+def create_response_cache(config: Config) -> ResponseCache:
+    return ResponseCache(
+        ttl=config.duplicate_cache_ttl,
+        max_entries=config.duplicate_cache_max_entries,
+        max_bytes=config.duplicate_cache_max_bytes
+    )
+
+
+def card_type_of(card: CardProfile) -> CardType:
+    try:
+        return CardType[card.card_type or "CHIP"]
+    except KeyError:
+        print(f"WARN: Unknown card type \"{card.card_type}\", using CHIP")
+        return CardType.CHIP
 
 
 class ConnectionHandler(QObject):
     price_updated = Signal(str)
     client_connected = Signal()
     client_disconnected = Signal()
+    transaction_requested = Signal()
+    # scenario steps and answers still scheduled for the transaction must stop
+    transaction_canceled = Signal()
 
-    def __init__(self):
+    def __init__(self, profile: TerminalProfile | None = None,
+                 response_cache: ResponseCache | None = None):
         super().__init__()
+        # simulated terminal, overrides the TerminalID of responses
+        self.profile = profile
+        self.amount: int = 0  # minor units of currency_code
+        self.currency_code: str = ""
+        self.default_tags = DefaultTags(
+            merchant_transaction_id=0,
+            zr_number=0,
+            device_number=0,
+            device_type=0,
+            terminal_id=profile.terminal_id if profile else "",
+        )
         self.is_stopping = False
-        self.conn: QTcpSocket | None = None
+        self.conn: QTcpSocket | QLocalSocket | None = None
         self.idle_message_timer = QTimer(self)
+        # closes sessions whose register stopped sending, restarted on reads
+        self.session_idle_timer = QTimer(self)
+        self.session_idle_timer.setSingleShot(True)
+        self.session_idle_timer.timeout.connect(self.on_session_idle)
+        config = get_config()
+        # shared by the sessions of a terminal so retries on a new
+        # connection still find the response
+        self.response_cache = response_cache or create_response_cache(config)
+        # (cache key, request) of the TransactionEMV waiting for a response,
+        # it holds one of the admission control's in-flight slots
+        self.pending_request: tuple[tuple, TransactionRequest] | None = None
+        self.frame_bucket = TokenBucket(config.session_frame_rate,
+                                        config.session_frame_burst)
+        self.byte_bucket = TokenBucket(config.session_byte_rate,
+                                       config.session_byte_burst)
+        admission.configure(config)
+        self.outbound = OutboundScheduler()
+        # set by a cancellation, responses for the transaction are dropped
+        # until the next TransactionEMV
+        self.canceled = False
+        self.cancel_started = 0.0
+        self.cancel_step: Callable[[], None] | None = None
+        self.cancel_timer = QTimer(self)
+        self.cancel_timer.setSingleShot(True)
+        self.cancel_timer.timeout.connect(self.run_cancel_step)
+        # commands from the UI thread, connected once for the handler's life
+        self.commands = CommandQueue()
+        self.commands.ready.connect(self.run_commands)
+        self.response_builder = ResponseBuilder(
+            get_executor(config.response_builder_workers,
+                         config.response_builder_mode),
+            self
+        )
+
+    @Slot()
+    def reload_config(self):
+        config = get_config()
+        self.response_cache.ttl = config.duplicate_cache_ttl
+        self.response_cache.max_entries = config.duplicate_cache_max_entries
+        self.response_cache.max_bytes = config.duplicate_cache_max_bytes
+        self.frame_bucket.configure(config.session_frame_rate,
+                                    config.session_frame_burst)
+        self.byte_bucket.configure(config.session_byte_rate,
+                                   config.session_byte_burst)
+        admission.configure(config)
+        if self.conn is not None:
+            self.restart_session_idle_timer()
+
+    def sendXML(self, xml: str, message_type: str) -> bytes:
+        data = frame_xml(xml)
+        self.send_ordered(data, message_type)
+        return data
+
+    def send_ordered(self, data: bytes, message_type: str):
+        if (self.response_builder.pending()
+                and MESSAGE_CLASSES[message_type][0] != Priority.CONTROL):
+            # keep the order behind responses still being built
+            self.response_builder.submit_ready(
+                data, functools.partial(self.send_bytes,
+                                        message_type=message_type))
+        else:
+            self.send_bytes(data, message_type)
 
-    def sendXML(self, xml: str):
+    def send_bytes(self, data: bytes, message_type: str = "transaction"):
         if self.is_stopping or not self.conn:
             if not self.is_stopping:
                 print("ERROR: Cannot send XML, \
                      no connected socket or handler is stopping")
             return
 
-        padded_xml: str = f"\x02\n{xml}\x03"
-        self.conn.write(padded_xml.encode())
+        self.outbound.send(data, message_type)
+        self.restart_session_idle_timer()
+
+    def send_transaction_emv(self, response_kwargs: dict) -> bool:
+        """Builds the TransactionEMV response on the response builder pool
+        and sends it once every earlier response of the session is sent."""
+        if self.conn is None:
+            print("ERROR: No connection")
+            return False
+
+        pending_request = self.pending_request
+        self.release_pending_request()
+        self.response_builder.submit(
+            build_transaction_response,
+            response_kwargs,
+            functools.partial(self.deliver_transaction_response,
+                              pending_request)
+        )
+        return True
+
+    def release_pending_request(self):
+        if self.pending_request is not None:
+            self.pending_request = None
+            admission.release_in_flight()
+
+    def deliver_transaction_response(self, pending_request: tuple[tuple, TransactionRequest] | None, data: bytes):
+        self.send_bytes(data)
+        if pending_request is not None:
+            key, request = pending_request
+            self.response_cache.put(key, request, data)
+
+    def send_duplicate_response(self, cached_response: bytes):
+        config = get_config()
+        print(f"INFO: Duplicate transaction request, policy \
+            \"{config.duplicate_policy}\", cache {self.response_cache.stats()}")
+        if config.duplicate_policy == "duplicate":
+            self.response_builder.submit(
+                build_transaction_response,
+                {
+                    'default_tags': self.default_tags,
+                    'response_code': TransactionResponseCode.DUPLICATE_TRANSACTION,
+                },
+                self.send_bytes
+            )
+        else:
+            # behind responses still being built, like a fresh one
+            self.send_ordered(cached_response, 'transaction')
 
     def send_idle_message_timed(self):
         idle_message_dict = MessageGenerator.get_terminal_status_emv_message(
-            default_tags=default_tags,
+            default_tags=self.default_tags,
             status_code=TerminalStatusResponseCode.IDLE
         )
 
         idle_message = XMLParser.dict_to_xml(idle_message_dict)
 
         if self.conn is not None:
-            self.sendXML(idle_message)
+            self.sendXML(idle_message, 'idle')
             print("INFO: Sent idle message")
         else:
             print("ERROR: No connection")
@@ -75,32 +236,33 @@ class ConnectionHandler(QObject):
                 pass
             print("INFO: Idle message timer stopped")
 
-    @Slot(TerminalStatusResponseCode)
-    def recieve_status_from_ui(self, status_code: TerminalStatusResponseCode):
-        self.send_status(status_code)
-
-    @Slot(str, int, DisplayMessageLevel)
-    def recieve_display_from_ui(self, text: str, message_code: int, message_level: DisplayMessageLevel):
-        self.send_display_message(text, message_code, message_level)
-
-    @Slot(TransactionResponseCode, dict)
-    def recieve_transaction_response_from_ui(self, response_code: TransactionResponseCode, card_details: dict):
-        if card_details != {}:
-            self.send_transaction_response(response_code, card_details)
-        else:
-            self.send_transaction_response(response_code)
+    @Slot()
+    def run_commands(self):
+        for command in self.commands.drain():
+            if isinstance(command, StatusCommand):
+                self.send_status(command.status_code)
+            elif isinstance(command, DisplayCommand):
+                self.send_display_message(command.text, command.message_code,
+                                          command.message_level)
+            elif isinstance(command, TransactionCommand):
+                if self.canceled:
+                    print(f"INFO: Dropped {command.response_code.name} "
+                          "for a canceled transaction")
+                    continue
+                self.send_transaction_response(command.response_code,
+                                               command.card)
 
     def send_status(self, status_code: TerminalStatusResponseCode):
         print(f"INFO: Sent status: {status_code}")
         status_response_dict = MessageGenerator.get_terminal_status_emv_message(
-            default_tags=default_tags,
+            default_tags=self.default_tags,
             status_code=status_code
         )
 
         status_response = XMLParser.dict_to_xml(status_response_dict)
 
         if self.conn is not None:
-            self.sendXML(status_response)
+            self.sendXML(status_response, 'status')
             print("INFO: Sent transaction response")
         else:
             print("ERROR: No connection")
@@ -108,7 +270,7 @@ class ConnectionHandler(QObject):
     def send_display_message(self, text: str, message_code: int, message_level: DisplayMessageLevel):
         print(f"INFO: Sent display message: {text}")
         display_message_response_dict = MessageGenerator.get_terminal_display_emv_message(
-            default_tags=default_tags,
+            default_tags=self.default_tags,
             display_message=text,
             display_message_code=message_code,
             display_message_level=message_level,
@@ -119,118 +281,176 @@ class ConnectionHandler(QObject):
             display_message_response_dict)
 
         if self.conn is not None:
-            self.sendXML(display_message_response)
+            self.sendXML(display_message_response, 'display')
             print("INFO: Sent transaction response")
         else:
             print("ERROR: No connection")
 
-    def send_transaction_response(self, response_code: TransactionResponseCode, card_details: dict = {}):
+    def send_transaction_response(self, response_code: TransactionResponseCode, card: CardProfile | None = None):
         print(f"Sent transaction response: {response_code}")
-        if card_details != {}:
-            transaction_response_dict = MessageGenerator.get_transaction_emv_response_message(
-                default_tags=default_tags,
-                response_code=response_code,
-                account_number=card_details["card_number"],
-                expiration_date=card_details["expiration_date"],
-                card_issuer=card_details["card_issuer"],
-                card_type=CardType.CHIP,
-                original_transaction_amount=float(price),
-                currency_code=currency_code
-            )
+        if card is not None:
+            self.send_transaction_emv({
+                'default_tags': self.default_tags,
+                'response_code': response_code,
+                'account_number': card.card_number,
+                'expiration_date': card.expiration_date,
+                'card_issuer': card.card_issuer,
+                'card_type': card_type_of(card),
+                'original_transaction_amount': self.amount,
+                'currency_code': self.currency_code,
+            })
         else:
-            transaction_response_dict = MessageGenerator.get_transaction_emv_response_message(
-                default_tags=default_tags,
-                response_code=response_code
-            )
-        transaction_response = XMLParser.dict_to_xml(transaction_response_dict)
-
-        if self.conn is not None:
-            self.sendXML(transaction_response)
-        else:
-            print("ERROR: No connection")
-
-    def send_payment(self, card_details: dict):
-        global price, currency_code
-
-        transaction_response_dict = MessageGenerator.get_transaction_emv_response_message(
-            default_tags=default_tags,
-            response_code=TransactionResponseCode.AUTHORISED,
-            account_number=card_details["card_number"],
-            expiration_date=card_details["expiration_date"],
-            card_issuer=card_details["card_issuer"],
-            card_type=CardType.CHIP,
-            original_transaction_amount=float(price),
-            currency_code=currency_code
-        )
+            self.send_transaction_emv({
+                'default_tags': self.default_tags,
+                'response_code': response_code,
+            })
+
+    def send_payment(self, card: CardProfile):
+        if self.canceled:
+            print("INFO: Dropped payment for a canceled transaction")
+            return
+        if self.send_transaction_emv({
+            'default_tags': self.default_tags,
+            'response_code': TransactionResponseCode.AUTHORISED,
+            'account_number': card.card_number,
+            'expiration_date': card.expiration_date,
+            'card_issuer': card.card_issuer,
+            'card_type': card_type_of(card),
+            'original_transaction_amount': self.amount,
+            'currency_code': self.currency_code,
+        }):
+            print("INFO: Sent payment")
 
-        transaction_response = XMLParser.dict_to_xml(transaction_response_dict)
+    def cancel_transaction(self):
+        """Stops everything still scheduled for the current transaction and
+        answers the cancellation with the configured delays."""
+        self.canceled = True
+        self.cancel_started = time.monotonic()
+        self.release_pending_request()
+        self.cancel_timer.stop()
+        self.transaction_canceled.emit()
+        self.schedule_cancel_step(get_config().cancel_approval_delay_ms,
+                                  self.send_cancelation_approval)
+
+    def schedule_cancel_step(self, delay_ms: int, step: Callable[[], None]):
+        if delay_ms <= 0:
+            step()
+            return
+        self.cancel_step = step
+        self.cancel_timer.start(delay_ms)
 
-        if self.conn is not None:
-            self.sendXML(transaction_response)
-            print("INFO: Sent payment")
-        else:
-            print("ERROR: No connection")
+    def run_cancel_step(self):
+        step, self.cancel_step = self.cancel_step, None
+        if step is not None:
+            step()
 
     def send_cancelation_approval(self):
         cancel_response_dict = MessageGenerator.get_transaction_emv_cancel_message(
-            default_tags=default_tags,
+            default_tags=self.default_tags,
             response_code=TransactionCancelCode.Cancel_accepted
         )
 
         cancel_response = XMLParser.dict_to_xml(cancel_response_dict)
 
         if self.conn is not None:
-            self.sendXML(cancel_response)
+            self.sendXML(cancel_response, 'cancel')
             print("INFO: Sent cancellation approval")
         else:
             print("ERROR: No connection")
+            return
 
-        QTimer.singleShot(500, functools.partial(
-            self.send_cancelation_response))
+        self.schedule_cancel_step(get_config().cancel_response_delay_ms,
+                                  self.send_cancelation_response)
 
     def send_cancelation_response(self):
-        cancel_response_dict = MessageGenerator.get_transaction_emv_response_message(
-            default_tags=default_tags,
-            response_code=TransactionResponseCode.Transaction_canceled_by_Merchant
+        if self.conn is None:
+            print("ERROR: No connection")
+            return
+        self.response_builder.submit(
+            build_transaction_response,
+            {
+                'default_tags': self.default_tags,
+                'response_code': TransactionResponseCode.Transaction_canceled_by_Merchant,
+            },
+            self.deliver_cancelation_response
         )
 
-        cancel_response = XMLParser.dict_to_xml(cancel_response_dict)
+    def deliver_cancelation_response(self, data: bytes):
+        self.send_bytes(data, 'cancel')
+        latency_ms = (time.monotonic() - self.cancel_started) * 1000
+        cancel_stats['cancels'] += 1
+        cancel_stats['total_ms'] += latency_ms
+        cancel_stats['max_ms'] = max(cancel_stats['max_ms'], latency_ms)
+        print(f"INFO: Sent cancellation {latency_ms:.1f} ms after the request")
 
-        if self.conn is not None:
-            self.sendXML(cancel_response)
-            print("INFO: Sent cancellation")
-        else:
-            print("ERROR: No connection")
-
-    def handle_connection(self, conn: QTcpSocket):
+    def handle_connection(self, conn: QTcpSocket | QLocalSocket):
         self.conn = conn
 
         self.client_connected.emit()
 
         if self.conn:
+            self.outbound.attach(self.conn)
+            if isinstance(self.conn, QTcpSocket):
+                tune_socket(self.conn, get_config())
             self.conn.readyRead.connect(self.read_data)
             self.conn.disconnected.connect(self.on_client_disconnected)
+            self.restart_session_idle_timer()
         else:
             print("ERROR: No conn")
 
+    def restart_session_idle_timer(self):
+        timeout = get_config().session_idle_timeout
+        if timeout > 0:
+            self.session_idle_timer.start(timeout * 1000)
+        else:
+            self.session_idle_timer.stop()
+
+    def on_session_idle(self):
+        if self.conn is None:
+            return
+        if self.pending_request is not None or self.response_builder.pending():
+            # a transaction is pending or being answered, the session is busy
+            self.restart_session_idle_timer()
+            return
+        print(f"WARN: No data from {peer_name(self.conn)} for \
+            {get_config().session_idle_timeout} seconds, closing the session")
+        # abort skips flushing to a peer that is most likely gone, the
+        # disconnected signal then cleans the session up
+        self.conn.abort()
+
     def read_data(self):
-        global price, currency_code
         if self.conn is None:
             print("ERROR: No conn")
             return
 
+        self.restart_session_idle_timer()
+
         data = self.conn.readAll()
 
         print("INFO: Received data")
 
-        xml_cleaned = self.clean_xml(data.data().decode())
-        parsed_xml = XMLParser.parse(xml_cleaned)
+        raw = data.data()
+        if not admission.admit(self.frame_bucket, self.byte_bucket,
+                               max(1, raw.count(b"\x03")), len(raw)):
+            print("WARN: Rate limit exceeded, answering terminal busy")
+            self.send_ordered(busy_reply(
+                raw, self.profile.terminal_id if self.profile else ""), 'busy')
+            return
+
+        try:
+            xml_cleaned = self.clean_xml(data.data().decode())
+        except UnicodeDecodeError as e:
+            self.reject_request(InvalidRequest(
+                None, EMPTY_DEFAULT_TAGS, (f"invalid encoding: {e}",)))
+            return
+
+        request = parse_request(xml_cleaned)
+        if isinstance(request, InvalidRequest):
+            self.reject_request(request)
+            return
 
-        if config.send_rsp_before_timeout:
-            timeout_value = XMLParser.get_value(
-                parsed_xml, "TimeoutResponse", 0)
-            timeout = int(
-                timeout_value) if timeout_value is not None else 0
+        if get_config().send_rsp_before_timeout:
+            timeout = request.timeout_response
 
             if timeout != 0:
                 print(f'INFO: Setting timeout interval to "{timeout}"')
@@ -238,36 +458,94 @@ class ConnectionHandler(QObject):
             else:
                 print('WARN: Timeout is "0"')
 
-        if XMLParser.get_value(parsed_xml, "TransactionEMV"):
-            price = XMLParser.get_value(
-                parsed_xml, 'TransactionAmount', '0.00')
-            currency_code = XMLParser.get_value(parsed_xml, 'CurrencyCode', '')
-            global default_tags
-            default_tags = DefaultTags(
-                merchant_transaction_id=XMLParser.get_value(
-                    parsed_xml, 'MerchantTransactionID', 0),
-                zr_number=XMLParser.get_value(parsed_xml, 'ZRNumber', 0),
-                device_number=XMLParser.get_value(
-                    parsed_xml, 'DeviceNumber', 0),
-                device_type=XMLParser.get_value(parsed_xml, 'DeviceType', 0),
-                terminal_id=XMLParser.get_value(parsed_xml, 'TerminalID', 0),
-            )
-        elif XMLParser.get_value(parsed_xml, "TransactionCancelEMV"):
-            self.send_cancelation_approval()
+        if isinstance(request, TransactionRequest):
+            default_tags = request.default_tags
+            if self.profile and self.profile.terminal_id:
+                default_tags = dataclasses.replace(
+                    default_tags, terminal_id=self.profile.terminal_id)
+
+            request_key = (default_tags.terminal_id,
+                           default_tags.merchant_transaction_id)
+            cached_response = self.response_cache.get(request_key, request)
+            if cached_response is None and self.pending_request is None \
+                    and not admission.acquire_in_flight():
+                print("WARN: Too many transactions in flight, answering terminal busy")
+                self.send_ordered(busy_reply_for(default_tags), 'busy')
+                return
+
+            self.amount = request.transaction_amount
+            self.currency_code = request.currency_code
+            self.default_tags = default_tags
+            self.canceled = False
+            if cached_response is not None:
+                self.send_duplicate_response(cached_response)
+                return
+            # a request replacing an unanswered one keeps its slot
+            self.pending_request = (request_key, request)
+            self.transaction_requested.emit()
+        elif isinstance(request, TransactionCancelRequest):
+            self.cancel_transaction()
+            return
+
+        self.price_updated.emit(
+            f"{format_amount(self.amount, self.currency_code)} {self.currency_code}")
+
+    def reject_request(self, request: InvalidRequest):
+        """Answers a malformed request without touching the session state."""
+        if request.tag is not None and request.tag not in SCHEMAS:
+            print(f"WARN: Ignored unsupported request \"{request.tag}\"")
+            return
+        print(f"WARN: Rejected request \"{request.tag}\": {', '.join(request.errors)}")
+        if request.tag == "TransactionCancelEMV":
+            self.sendXML(XMLParser.dict_to_xml(
+                MessageGenerator.get_transaction_emv_cancel_message(
+                    default_tags=request.default_tags,
+                    response_code=TransactionCancelCode.Fault_request
+                )), 'reject')
+            return
+
+        if request.tag == "TransactionEMV":
+            response_code = TransactionResponseCode.FORMAT_ERROR
+        else:
+            response_code = TransactionResponseCode.Fault_request
+        self.response_builder.submit(
+            build_transaction_response,
+            {
+                'default_tags': request.default_tags,
+                'response_code': response_code,
+            },
+            functools.partial(self.send_bytes, message_type='reject')
+        )
 
-        self.price_updated.emit(f"{price} {currency_code}")
+    def is_idle(self) -> bool:
+        """True when no transaction is waiting and everything is sent."""
+        return (self.pending_request is None
+                and not self.response_builder.pending()
+                and not self.outbound.pending()
+                and (self.conn is None or self.conn.bytesToWrite() == 0))
 
     def shutdown(self):
         print("INFO: ConnectionHandler shutdown initiated")
         self.is_stopping = True
-        if self.conn:
-            self.conn.close()
-            self.conn.deleteLater()
-        self.conn = None
+        self.release_pending_request()
+        self.response_builder.clear()
+        # hand everything queued to the socket, close() still writes it
+        self.outbound.flush(force=True)
+        self.outbound.clear()
+        # close() emits disconnected right away, on_client_disconnected
+        # clears self.conn
+        conn, self.conn = self.conn, None
+        if conn:
+            conn.close()
+            conn.deleteLater()
 
     def on_client_disconnected(self):
         print("INFO: Client disconnected")
         self.stop_idle_message_timer()
+        self.session_idle_timer.stop()
+        self.cancel_timer.stop()
+        self.release_pending_request()
+        self.outbound.clear()
         self.client_disconnected.emit()
         self.conn = None
 
@@ -275,7 +553,332 @@ class ConnectionHandler(QObject):
         return xml.strip("\x02\x03")
 
 
+def peer_name(conn: QTcpSocket | QLocalSocket) -> str:
+    if isinstance(conn, QLocalSocket):
+        return conn.fullServerName()
+    return f"{conn.peerAddress().toString()}:{conn.peerPort()}"
+
+
+def listen_local(server: QLocalServer, path: str,
+                 descriptor: int | None = None) -> bool:
+    """Listens on a Unix domain socket, or on `descriptor` already listening
+    on it. A stale socket file left by a process that did not exit cleanly
+    is replaced, one another process still serves is not."""
+    if descriptor is not None:
+        listening = server.listen(descriptor)
+        if not listening:
+            os.close(descriptor)
+    elif unix_socket_in_use(path):
+        print(f"ERROR: \"{path}\" is served by another process")
+        return False
+    else:
+        QLocalServer.removeServer(path)
+        listening = server.listen(path)
+    if not listening:
+        print(f"ERROR: Could not listen on \"{path}\": {server.errorString()}")
+        return False
+    print(f"INFO: Listening on \"{path}\"")
+    return True
+
+
+def start_tls_proxy(server: QLocalServer, tls_port: int, config: Config,
+                    descriptor: int | None = None,
+                    reuse_port: bool = False) -> TlsProxy | None:
+    """Listens on a private Unix socket and starts the TLS proxy that
+    forwards the decrypted connections to it, on `descriptor` when the TLS
+    port was taken over from another process."""
+    try:
+        context = create_server_context(config.tls_certificate,
+                                        config.tls_private_key,
+                                        config.tls_session_tickets)
+    except (OSError, ssl.SSLError) as e:
+        print(f"ERROR: Could not load TLS certificate: {e}")
+        if descriptor is not None:
+            os.close(descriptor)
+        return None
+
+    # only this user can reach the directory (0700), the proxy removes it
+    backend_dir = tempfile.mkdtemp(prefix=f"sbterminal-tls-{tls_port}-")
+    backend_path = os.path.join(backend_dir, "backend.sock")
+    server.setSocketOptions(QLocalServer.SocketOption.UserAccessOption)
+    if not listen_local(server, backend_path):
+        shutil.rmtree(backend_dir, ignore_errors=True)
+        if descriptor is not None:
+            os.close(descriptor)
+        return None
+
+    proxy = TlsProxy(tls_port, backend_path, context, descriptor, reuse_port)
+    if not proxy.start():
+        server.close()
+        shutil.rmtree(backend_dir, ignore_errors=True)
+        return None
+    return proxy
+
+
+def tune_socket(conn: QTcpSocket, config: Config):
+    """Applies the configured TCP options to an accepted ECR connection."""
+    conn.setSocketOption(QAbstractSocket.SocketOption.LowDelayOption,
+                         int(config.tcp_nodelay))
+    conn.setSocketOption(QAbstractSocket.SocketOption.KeepAliveOption,
+                         int(config.tcp_keepalive))
+    if config.socket_send_buffer > 0:
+        conn.setSocketOption(
+            QAbstractSocket.SocketOption.SendBufferSizeSocketOption,
+            config.socket_send_buffer)
+    if config.socket_receive_buffer > 0:
+        conn.setSocketOption(
+            QAbstractSocket.SocketOption.ReceiveBufferSizeSocketOption,
+            config.socket_receive_buffer)
+
+    if not config.tcp_keepalive:
+        return
+    # Qt has no options for the keepalive timing, set them on the
+    # descriptor, detach so the Python socket does not close it
+    sock = socket.socket(fileno=conn.socketDescriptor())
+    try:
+        for name, value in (("TCP_KEEPIDLE", config.tcp_keepalive_idle),
+                            ("TCP_KEEPINTVL", config.tcp_keepalive_interval),
+                            ("TCP_KEEPCNT", config.tcp_keepalive_count)):
+            option = getattr(socket, name, None)
+            if option is not None and value > 0:
+                sock.setsockopt(socket.IPPROTO_TCP, option, value)
+    except OSError as e:
+        print(f"WARN: Could not set keepalive timing: {e}")
+    finally:
+        sock.detach()
+
+
+class TcpServer(QTcpServer):
+    def apply_limits(self, config: Config):
+        """Bounds the connections waiting to be accepted, in the kernel's
+        listen queue and in Qt's pending queue."""
+        self.setMaxPendingConnections(config.max_pending_connections)
+        if hasattr(self, "setListenBacklogSize"):  # Qt 6.3
+            self.setListenBacklogSize(config.listen_backlog)
+
+    @Slot(int)
+    def relisten(self, port: int):
+        self.close()
+        if not self.listen(QHostAddress(QHostAddress.SpecialAddress.Any), port):
+            print(f"ERROR: Could not listen on port {port}: \
+                {self.errorString()}")
+            return
+        print(f"INFO: Server moved to port {port}")
+
+    def listen_reuse_port(self, port: int, backlog: int = 50) -> bool:
+        """Listens on a socket bound with SO_REUSEPORT so several worker
+        processes can accept on the same port, the kernel balances
+        connections between them."""
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(("", port))
+            sock.listen(backlog)
+        except (OSError, AttributeError) as e:
+            print(f"ERROR: Could not listen on port {port} with \
+                SO_REUSEPORT: {e}")
+            return False
+        return self.setSocketDescriptor(sock.detach())
+
+
+class TerminalListener(QObject):
+    """Simulates one terminal without the GUI: listens on the profile's port,
+    runs an independent ConnectionHandler per ECR connection and answers
+    transactions with the profile's card."""
+
+    def __init__(self, profile: TerminalProfile, parent=None):
+        super().__init__(parent)
+        if profile.card_type and profile.card_type not in CardType.__members__:
+            print(f"WARN: Terminal \"{profile.terminal_id}\" has an unknown "
+                  f"card type \"{profile.card_type}\", using CHIP")
+            profile = dataclasses.replace(profile, card_type="CHIP")
+        self.profile = profile
+        self.response_cache = create_response_cache(get_config())
+        self.sessions: set[ConnectionHandler] = set()
+        # sessions with an answer scheduled but not sent yet
+        self.answering: set[ConnectionHandler] = set()
+        self.draining = False
+        self.connections = 0
+        self.transactions = 0
+        self.server_socket = TcpServer(self)
+        self.server_socket.apply_limits(get_config())
+        self.server_socket.newConnection.connect(self.on_new_connection)
+        self.local_server = QLocalServer(self)
+        self.local_server.newConnection.connect(self.on_new_connection)
+        # the socket file is removed on close unless another process
+        # shares it
+        self.owns_local_path = False
+        # decrypted connections from the TLS proxy
+        self.tls_server = QLocalServer(self)
+        self.tls_server.newConnection.connect(self.on_new_connection)
+        self.tls_proxy: TlsProxy | None = None
+
+    def listen(self, reuse_port: bool = False,
+               descriptors: dict[str, int] | None = None,
+               inherited: bool = False, handoff: bool = False) -> bool:
+        """Listens on the profile's Unix socket path, TLS port and port.
+        Sockets found in `descriptors` (keys as in `socket_descriptors`) are
+        already listening, taken over from another process or `inherited`
+        from the supervisor, which then keeps the socket file. The TLS port
+        is shared with SO_REUSEPORT with `reuse_port` or in `handoff`
+        mode."""
+        descriptors = {} if descriptors is None else descriptors
+        config = get_config()
+        path = self.profile.unix_socket_path
+        if path:
+            descriptor = descriptors.pop(f"unix:{path}", None)
+            if descriptor is None:
+                sock = bind_unix_socket(path, config.listen_backlog)
+                if sock is None:
+                    return False
+                descriptor = sock.detach()
+            if not listen_local(self.local_server, path, descriptor):
+                return False
+            self.owns_local_path = not inherited
+        if config.tls_enabled and self.profile.tls_port:
+            self.tls_proxy = start_tls_proxy(
+                self.tls_server, self.profile.tls_port, config,
+                descriptors.pop(f"tls:{self.profile.tls_port}", None),
+                reuse_port or handoff)
+            if self.tls_proxy is None:
+                return False
+        if not self.profile.port:
+            return bool(path or self.tls_proxy)
+
+        descriptor = descriptors.pop(f"tcp:{self.profile.port}", None)
+        if descriptor is not None:
+            listening = self.server_socket.setSocketDescriptor(descriptor)
+            if not listening:
+                os.close(descriptor)
+        elif reuse_port:
+            listening = self.server_socket.listen_reuse_port(
+                self.profile.port, config.listen_backlog)
+        else:
+            listening = self.server_socket.listen(
+                QHostAddress(QHostAddress.SpecialAddress.Any), self.profile.port)
+        if not listening:
+            print(f"ERROR: Could not start terminal \
+                \"{self.profile.terminal_id}\": {self.server_socket.errorString()}")
+            return False
+
+        print(f"INFO: Terminal \"{self.profile.terminal_id}\" listening on \
+            port {self.profile.port}")
+        return True
+
+    def on_new_connection(self):
+        for server in (self.server_socket, self.local_server, self.tls_server):
+            while server.hasPendingConnections():
+                self.start_session(server.nextPendingConnection())
+
+    def start_session(self, conn: QTcpSocket | QLocalSocket):
+        handler = ConnectionHandler(self.profile, self.response_cache)
+        handler.setParent(self)
+        handler.transaction_requested.connect(
+            functools.partial(self.answer_transaction, handler))
+        handler.client_disconnected.connect(
+            functools.partial(self.on_session_closed, handler))
+        handler.transaction_canceled.connect(
+            functools.partial(self.answering.discard, handler))
+        self.sessions.add(handler)
+        self.connections += 1
+        handler.handle_connection(conn)
+
+    def answer_transaction(self, handler: ConnectionHandler):
+        self.transactions += 1
+        self.answering.add(handler)
+        # the handler as context drops the answer if the session is gone
+        QTimer.singleShot(
+            get_config().headless_response_delay_ms, handler,
+            functools.partial(self.send_answer, handler))
+
+    def send_answer(self, handler: ConnectionHandler):
+        if handler not in self.answering:
+            return  # canceled meanwhile
+        self.answering.discard(handler)
+        handler.send_payment(self.profile.card_profile())
+
+    def on_session_closed(self, handler: ConnectionHandler):
+        self.sessions.discard(handler)
+        self.answering.discard(handler)
+        handler.deleteLater()
+
+    def socket_descriptors(self) -> dict[str, int]:
+        """Listening sockets for a handoff, by "tcp:<port>", "unix:<path>"
+        and "tls:<port>"."""
+        descriptors = {}
+        if self.server_socket.isListening():
+            descriptors[f"tcp:{self.profile.port}"] = int(
+                self.server_socket.socketDescriptor())
+        if self.local_server.isListening():
+            descriptors[f"unix:{self.profile.unix_socket_path}"] = int(
+                self.local_server.socketDescriptor())
+        if (self.tls_proxy is not None
+                and self.tls_proxy.socket_descriptor() >= 0):
+            descriptors[f"tls:{self.profile.tls_port}"] = (
+                self.tls_proxy.socket_descriptor())
+        return descriptors
+
+    def handed_off(self):
+        """The socket file now belongs to the process the sockets were
+        handed to."""
+        self.owns_local_path = False
+
+    def close_local(self):
+        self.local_server.close()
+        if self.owns_local_path:
+            self.owns_local_path = False
+            try:
+                os.unlink(self.profile.unix_socket_path)
+            except FileNotFoundError:
+                pass
+
+    def drain(self):
+        """Stops accepting, sessions are closed as soon as they are idle."""
+        if not self.draining:
+            self.draining = True
+            self.server_socket.close()
+            self.close_local()
+            if self.tls_proxy is not None:
+                self.tls_proxy.stop_accepting()
+            print(f"INFO: Terminal \"{self.profile.terminal_id}\" draining \
+                {len(self.sessions)} session(s)")
+        for handler in list(self.sessions):
+            if handler not in self.answering and handler.is_idle():
+                self.sessions.discard(handler)
+                handler.shutdown()
+                handler.deleteLater()
+
+    def drained(self) -> bool:
+        return not self.sessions
+
+    def metrics(self) -> dict:
+        return {
+            'connections': self.connections,
+            'sessions': len(self.sessions),
+            'transactions': self.transactions,
+            **(self.tls_proxy.metrics() if self.tls_proxy else {}),
+        }
+
+    def close(self):
+        for handler in list(self.sessions):
+            handler.shutdown()
+        self.sessions.clear()
+        self.server_socket.close()
+        self.close_local()
+        self.close_tls()
+
+    def close_tls(self):
+        if self.tls_proxy is not None:
+            self.tls_proxy.close()
+            self.tls_proxy = None
+        self.tls_server.close()
+
+
 class ServerThread(QThread):
+    port_changed = Signal(int)
+    config_reloaded = Signal()
+
     def __init__(self, port, parent=None):
         super().__init__(parent)
         self.port = port
@@ -286,28 +889,51 @@ class ServerThread(QThread):
         self.is_stopping = False
 
     def get_ip(self) -> str:
-        ip = ""
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-        except Exception as e:
-            print(f"WARNING: Could not determine device IP address: {e}")
-        return ip
+        """Returns the cached device IP address, it is resolved in the
+        background by `ip_resolver`."""
+        return ip_resolver.ip
 
     def run(self):
-        self.server_socket = QTcpServer()
-        if not self.server_socket.listen(QHostAddress(QHostAddress.SpecialAddress.Any), self.port):
+        config = get_config()
+        self.server_socket = TcpServer()
+        self.server_socket.apply_limits(config)
+        self.local_server = QLocalServer()
+        self.tls_server = QLocalServer()
+        self.tls_proxy = None
+        if config.tls_enabled:
+            self.tls_proxy = start_tls_proxy(
+                self.tls_server, config.tls_port, config)
+            self.tls_server.newConnection.connect(
+                functools.partial(self.on_new_local_connection, self.tls_server),
+                Qt.ConnectionType.DirectConnection)
+        if config.unix_socket_path and listen_local(
+                self.local_server, config.unix_socket_path):
+            self.local_server.newConnection.connect(
+                functools.partial(self.on_new_local_connection, self.local_server),
+                Qt.ConnectionType.DirectConnection)
+        elif not config.tcp_enabled and self.tls_proxy is None:
+            print("ERROR: TCP is disabled and no Unix socket is listening")
+            return
+
+        if config.tcp_enabled and not self.server_socket.listen(
+                QHostAddress(QHostAddress.SpecialAddress.Any), self.port):
             print(f"ERROR: Could not start server: \
                 {self.server_socket.errorString()}")
             return
 
+        ip_resolver.start()
+        # only for the log line, the resolver thread keeps it up to date
+        ip_resolver.resolved.wait(1.0)
         self.ip = self.get_ip()
 
         print(f"INFO: Listening on: {self.ip}:{self.port}")
 
-        self.server_socket.newConnection.connect(self.on_new_connection)
+        # this thread object lives in the GUI thread, a direct connection
+        # sets the session up here, in the handler's thread
+        self.server_socket.newConnection.connect(
+            self.on_new_connection, Qt.ConnectionType.DirectConnection)
+        self.port_changed.connect(self.server_socket.relisten)
+        self.config_reloaded.connect(self.connection_handler.reload_config)
 
         self.exec()
 
@@ -317,6 +943,17 @@ class ServerThread(QThread):
         if self.server_socket:
             print(f"INFO: Server on socket: {self.port} closed")
             self.server_socket.close()
+        self.local_server.close()
+        if self.tls_proxy:
+            self.tls_proxy.close()
+        self.tls_server.close()
+
+    def apply_config(self, new_config: Config):
+        """Applies a reloaded config without restarting the thread."""
+        self.config_reloaded.emit()
+        if new_config.port != self.port:
+            self.port = new_config.port
+            self.port_changed.emit(self.port)
 
     def on_new_connection(self):
         if self.is_stopping:
@@ -326,6 +963,14 @@ class ServerThread(QThread):
         conn = self.server_socket.nextPendingConnection()
         self.connection_handler.handle_connection(conn)
 
+    def on_new_local_connection(self, server: QLocalServer):
+        if self.is_stopping:
+            return
+
+        print("INFO: Local client connected")
+        conn = server.nextPendingConnection()
+        self.connection_handler.handle_connection(conn)
+
     def stop(self):
         print("INFO: Server thread stopped")
         self.is_stopping = True
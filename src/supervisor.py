@@ -0,0 +1,171 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from handoff import bind_unix_socket
+from outbound import DERIVED_SUFFIXES, derived_metrics
+from terminal_config import get_config, get_terminal_profiles
+
+METRICS_PREFIX = "METRICS "
+
+# current values rather than counters, a dead worker's are dropped
+GAUGES = frozenset({'sessions', 'in_flight'})
+
+
+def add_metrics(totals: dict, metrics: dict):
+    """Adds a worker's counters to `totals`, maxima are combined with max
+    and derived values are left to derived_metrics."""
+    for key, value in metrics.items():
+        if (not isinstance(value, (int, float))
+                or key.endswith(DERIVED_SUFFIXES)):
+            continue
+        if key.endswith("_max_ms"):
+            totals[key] = max(totals.get(key, 0), value)
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+
+class WorkerProcess:
+    def __init__(self, worker_id: int, args: list[str],
+                 pass_fds: tuple[int, ...] = ()):
+        self.worker_id = worker_id
+        self.args = args
+        self.pass_fds = pass_fds
+        self.process: subprocess.Popen | None = None
+        self.metrics: dict = {}
+        # counters of the worker's earlier processes, so totals do not go
+        # backwards when it is restarted
+        self.base_metrics: dict = {}
+        self.output_thread: threading.Thread | None = None
+        self.restarts = 0
+        self.started_at = 0.0
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, bufsize=1, pass_fds=self.pass_fds)
+        self.started_at = time.monotonic()
+        self.output_thread = threading.Thread(
+            target=self.read_output, daemon=True,
+            name=f"Worker{self.worker_id}Output")
+        self.output_thread.start()
+
+    def read_output(self):
+        for line in self.process.stdout:
+            line = line.rstrip("\n")
+            if line.startswith(METRICS_PREFIX):
+                try:
+                    self.metrics = json.loads(line[len(METRICS_PREFIX):])
+                except ValueError:
+                    pass
+                continue
+            print(f"[worker {self.worker_id}] {line}", flush=True)
+
+
+class Supervisor:
+    """Runs `workers` copies of the headless server that share their
+    listening ports through SO_REUSEPORT and their Unix sockets through
+    inherited descriptors, restarts workers that exit and merges their
+    journal output and metrics."""
+
+    def __init__(self, workers: int, metrics_interval: float = 5.0,
+                 restart_delay: float = 1.0):
+        self.metrics_interval = metrics_interval
+        self.restart_delay = restart_delay
+        self.stop_event = threading.Event()
+        worker_args = [sys.executable, sys.argv[0], "--reuse-port",
+                       "--metrics-interval", str(metrics_interval)]
+        # a Unix socket path can only be bound once, the workers accept on
+        # the supervisor's socket
+        self.unix_sockets: dict[str, socket.socket] = {}
+        config = get_config()
+        for profile in get_terminal_profiles(config):
+            path = profile.unix_socket_path
+            if path and path not in self.unix_sockets:
+                sock = bind_unix_socket(path, config.listen_backlog)
+                if sock is not None:
+                    self.unix_sockets[path] = sock
+        if self.unix_sockets:
+            worker_args += ["--inherit", json.dumps(
+                {f"unix:{path}": sock.fileno()
+                 for path, sock in self.unix_sockets.items()})]
+        pass_fds = tuple(sock.fileno() for sock in self.unix_sockets.values())
+        self.workers = [WorkerProcess(worker_id, worker_args, pass_fds)
+                        for worker_id in range(workers)]
+
+    def run(self):
+        for worker in self.workers:
+            worker.start()
+        print(f"INFO: Started {len(self.workers)} worker processes")
+
+        last_report = time.monotonic()
+        while not self.stop_event.wait(0.5):
+            for worker in self.workers:
+                self.check_worker(worker)
+
+            if (self.metrics_interval > 0
+                    and time.monotonic() - last_report >= self.metrics_interval):
+                last_report = time.monotonic()
+                print(f"INFO: Metrics {json.dumps(self.aggregate_metrics())}",
+                      flush=True)
+
+        self.shutdown()
+
+    def check_worker(self, worker: WorkerProcess):
+        exit_code = worker.process.poll()
+        if exit_code is None or self.stop_event.is_set():
+            return
+
+        print(f"WARN: Worker {worker.worker_id} exited with code {exit_code}")
+        # back off when a worker keeps crashing right after start
+        if time.monotonic() - worker.started_at < self.restart_delay:
+            time.sleep(self.restart_delay)
+        worker.restarts += 1
+        # the last snapshot may still be in the pipe
+        worker.output_thread.join(1.0)
+        add_metrics(worker.base_metrics,
+                    {key: value for key, value in worker.metrics.items()
+                     if key not in GAUGES})
+        worker.metrics = {}
+        worker.start()
+        print(f"INFO: Restarted worker {worker.worker_id}")
+
+    def aggregate_metrics(self) -> dict:
+        """Sums the workers' counters, takes the largest of the maxima and
+        computes rates and averages from the sums."""
+        totals: dict = {'workers': len(self.workers),
+                        'restarts': sum(w.restarts for w in self.workers)}
+        for worker in self.workers:
+            add_metrics(totals, worker.base_metrics)
+            add_metrics(totals, worker.metrics)
+
+        totals.update(derived_metrics(totals))
+        return totals
+
+    def stop(self):
+        self.stop_event.set()
+
+    def shutdown(self):
+        # workers drain their sessions on SIGTERM
+        for worker in self.workers:
+            if worker.process.poll() is None:
+                worker.process.terminate()
+        deadline = time.monotonic() + get_config().drain_timeout + 5
+        for worker in self.workers:
+            try:
+                worker.process.wait(
+                    timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                worker.process.kill()
+        for path, sock in self.unix_sockets.items():
+            sock.close()
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        print(f"INFO: Workers stopped, final metrics \
+            {json.dumps(self.aggregate_metrics())}")
@@ -1,99 +1,502 @@
 import os
+import atexit
+import tempfile
+import threading
 import yaml
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+from typing import Callable
+
+# libyaml bindings are much faster, fall back to the pure Python ones
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+SafeDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+@dataclass(slots=True, frozen=True)
+class CardProfile:
+    card_number: str
+    expiration_date: str
+    cvv: str
+    card_issuer: str
+    card_type: str
+
+
+@dataclass
+class TerminalProfile:
+    port: int
+    terminal_id: str
+    card_issuer: str
+    card_type: str
+    card_number: str
+    expiration_date: str
+    cvv: str
+    # port 0 listens on the Unix socket only
+    unix_socket_path: str = ""
+    tls_port: int = 0
+
+    def card_profile(self) -> CardProfile:
+        return CardProfile(
+            card_number=self.card_number,
+            expiration_date=self.expiration_date,
+            cvv=self.cvv,
+            card_issuer=self.card_issuer,
+            card_type=self.card_type,
+        )
 
 
 @dataclass
 class Config:
     port: int
+    tcp_enabled: bool
+    unix_socket_path: str
+    tls_enabled: bool
+    tls_port: int
+    tls_certificate: str
+    tls_private_key: str
+    tls_session_tickets: int
     send_rsp_before_timeout: bool
     card_issuer: str
     card_type: str
     card_number: str
     expiration_date: str
     cvv: str
+    duplicate_policy: str
+    duplicate_cache_ttl: int
+    duplicate_cache_max_entries: int
+    duplicate_cache_max_bytes: int
+    headless_response_delay_ms: int
+    response_builder_workers: int
+    response_builder_mode: str
+    tcp_nodelay: bool
+    tcp_keepalive: bool
+    tcp_keepalive_idle: int
+    tcp_keepalive_interval: int
+    tcp_keepalive_count: int
+    socket_send_buffer: int
+    socket_receive_buffer: int
+    session_idle_timeout: int
+    drain_timeout: int
+    listen_backlog: int
+    max_pending_connections: int
+    session_frame_rate: float
+    session_frame_burst: int
+    session_byte_rate: float
+    session_byte_burst: int
+    global_frame_rate: float
+    global_byte_rate: float
+    max_in_flight_transactions: int
+    cancel_approval_delay_ms: int
+    cancel_response_delay_ms: int
+    scenario_step_delay_ms: int
+    terminals: list[TerminalProfile]
+
+
+def dict_to_terminal_profile(data: dict) -> TerminalProfile:
+    return TerminalProfile(
+        port=data.get("port", 0),
+        terminal_id=str(data.get("terminal_id", "")),
+        card_issuer=data.get("card_issuer", ""),
+        card_type=data.get("card_type", ""),
+        card_number=data.get("card_number", ""),
+        expiration_date=data.get("expiration_date", ""),
+        cvv=data.get("cvc", ""),
+        unix_socket_path=data.get("unix_socket_path", ""),
+        tls_port=data.get("tls_port", 0),
+    )
+
+
+def terminal_profile_to_dict(profile: TerminalProfile) -> dict:
+    return {
+        'port': profile.port,
+        'terminal_id': profile.terminal_id,
+        'card_issuer': profile.card_issuer,
+        'card_type': profile.card_type,
+        'card_number': profile.card_number,
+        'expiration_date': profile.expiration_date,
+        'cvc': profile.cvv,
+        'unix_socket_path': profile.unix_socket_path,
+        'tls_port': profile.tls_port,
+    }
 
 
 def dict_to_config(data: dict) -> Config:
     return Config(
         port=data.get("port", 0),
+        tcp_enabled=data.get("tcp_enabled", True),
+        unix_socket_path=data.get("unix_socket_path", ""),
+        tls_enabled=data.get("tls_enabled", False),
+        tls_port=data.get("tls_port", 0),
+        tls_certificate=data.get("tls_certificate", ""),
+        tls_private_key=data.get("tls_private_key", ""),
+        tls_session_tickets=data.get("tls_session_tickets", 2),
         send_rsp_before_timeout=data.get("send_rsp_before_timeout", False),
         card_issuer=data.get("card_issuer", ""),
         card_type=data.get("card_type", ""),
         card_number=data.get("card_number", ""),
         expiration_date=data.get("expiration_date", ""),
         cvv=data.get("cvc", ""),
+        duplicate_policy=data.get("duplicate_policy", "resend"),
+        duplicate_cache_ttl=data.get("duplicate_cache_ttl", 0),
+        duplicate_cache_max_entries=data.get("duplicate_cache_max_entries", 0),
+        duplicate_cache_max_bytes=data.get("duplicate_cache_max_bytes", 0),
+        headless_response_delay_ms=data.get("headless_response_delay_ms", 0),
+        response_builder_workers=data.get("response_builder_workers", 0),
+        response_builder_mode=data.get("response_builder_mode", "thread"),
+        tcp_nodelay=data.get("tcp_nodelay", True),
+        tcp_keepalive=data.get("tcp_keepalive", True),
+        tcp_keepalive_idle=data.get("tcp_keepalive_idle", 60),
+        tcp_keepalive_interval=data.get("tcp_keepalive_interval", 10),
+        tcp_keepalive_count=data.get("tcp_keepalive_count", 5),
+        socket_send_buffer=data.get("socket_send_buffer", 0),
+        socket_receive_buffer=data.get("socket_receive_buffer", 0),
+        session_idle_timeout=data.get("session_idle_timeout", 0),
+        drain_timeout=data.get("drain_timeout", 30),
+        listen_backlog=data.get("listen_backlog", 50),
+        max_pending_connections=data.get("max_pending_connections", 30),
+        session_frame_rate=data.get("session_frame_rate", 0),
+        session_frame_burst=data.get("session_frame_burst", 0),
+        session_byte_rate=data.get("session_byte_rate", 0),
+        session_byte_burst=data.get("session_byte_burst", 0),
+        global_frame_rate=data.get("global_frame_rate", 0),
+        global_byte_rate=data.get("global_byte_rate", 0),
+        max_in_flight_transactions=data.get("max_in_flight_transactions", 0),
+        cancel_approval_delay_ms=data.get("cancel_approval_delay_ms", 0),
+        cancel_response_delay_ms=data.get("cancel_response_delay_ms", 500),
+        scenario_step_delay_ms=data.get("scenario_step_delay_ms", 500),
+        terminals=[dict_to_terminal_profile(terminal)
+                   for terminal in data.get("terminals") or []],
     )
 
 
 def config_to_dict(config: Config) -> dict:
     return {
         'port': config.port,
+        'tcp_enabled': config.tcp_enabled,
+        'unix_socket_path': config.unix_socket_path,
+        'tls_enabled': config.tls_enabled,
+        'tls_port': config.tls_port,
+        'tls_certificate': config.tls_certificate,
+        'tls_private_key': config.tls_private_key,
+        'tls_session_tickets': config.tls_session_tickets,
         'send_rsp_before_timeout': config.send_rsp_before_timeout,
         'card_issuer': config.card_issuer,
         'card_number': config.card_number,
         'card_type': config.card_type,
         'expiration_date': config.expiration_date,
         'cvc': config.cvv,
+        'duplicate_policy': config.duplicate_policy,
+        'duplicate_cache_ttl': config.duplicate_cache_ttl,
+        'duplicate_cache_max_entries': config.duplicate_cache_max_entries,
+        'duplicate_cache_max_bytes': config.duplicate_cache_max_bytes,
+        'headless_response_delay_ms': config.headless_response_delay_ms,
+        'response_builder_workers': config.response_builder_workers,
+        'response_builder_mode': config.response_builder_mode,
+        'tcp_nodelay': config.tcp_nodelay,
+        'tcp_keepalive': config.tcp_keepalive,
+        'tcp_keepalive_idle': config.tcp_keepalive_idle,
+        'tcp_keepalive_interval': config.tcp_keepalive_interval,
+        'tcp_keepalive_count': config.tcp_keepalive_count,
+        'socket_send_buffer': config.socket_send_buffer,
+        'socket_receive_buffer': config.socket_receive_buffer,
+        'session_idle_timeout': config.session_idle_timeout,
+        'drain_timeout': config.drain_timeout,
+        'listen_backlog': config.listen_backlog,
+        'max_pending_connections': config.max_pending_connections,
+        'session_frame_rate': config.session_frame_rate,
+        'session_frame_burst': config.session_frame_burst,
+        'session_byte_rate': config.session_byte_rate,
+        'session_byte_burst': config.session_byte_burst,
+        'global_frame_rate': config.global_frame_rate,
+        'global_byte_rate': config.global_byte_rate,
+        'max_in_flight_transactions': config.max_in_flight_transactions,
+        'cancel_approval_delay_ms': config.cancel_approval_delay_ms,
+        'cancel_response_delay_ms': config.cancel_response_delay_ms,
+        'scenario_step_delay_ms': config.scenario_step_delay_ms,
+        'terminals': [terminal_profile_to_dict(terminal)
+                      for terminal in config.terminals],
     }
 
 
 default_config_dict: dict = {
     'port': 2605,
+    # ECR software on the same machine can connect through a Unix domain
+    # socket at this path instead of TCP, tcp_enabled: false serves it only
+    'tcp_enabled': True,
+    'unix_socket_path': '',
+    # TLS listener on tls_port (or a terminal's tls_port) with the PEM
+    # certificate and key, reconnecting registers resume their session with
+    # one of the tls_session_tickets issued per handshake, 0 disables it
+    'tls_enabled': False,
+    'tls_port': 2606,
+    'tls_certificate': '',
+    'tls_private_key': '',
+    'tls_session_tickets': 2,
     'send_rsp_before_timeout': True,
     'card_issuer': 'VS',
     'card_type': 'CHIP',
     'card_number': '**********1234',
     'expiration_date': '2512',
-    'cvc': '353'
+    'cvc': '353',
+    # "resend" repeats the stored response, "duplicate" answers
+    # DUPLICATE_TRANSACTION
+    'duplicate_policy': 'resend',
+    'duplicate_cache_ttl': 300,
+    'duplicate_cache_max_entries': 256,
+    'duplicate_cache_max_bytes': 1024 * 1024,
+    # headless mode (headless.py) simulates one terminal per entry in
+    # "terminals", or a single one from the settings above when it is empty
+    'headless_response_delay_ms': 0,
+    # TransactionEMV responses are built on a pool of this many "thread" or
+    # "process" workers, 0 builds them on the connection's thread
+    'response_builder_workers': 0,
+    'response_builder_mode': 'thread',
+    # accepted ECR connections: keepalive probes start after
+    # tcp_keepalive_idle seconds without traffic, buffer sizes of 0 keep the
+    # OS default and sessions without traffic for session_idle_timeout
+    # seconds are closed, 0 never closes them
+    'tcp_nodelay': True,
+    'tcp_keepalive': True,
+    'tcp_keepalive_idle': 60,
+    'tcp_keepalive_interval': 10,
+    'tcp_keepalive_count': 5,
+    'socket_send_buffer': 0,
+    'socket_receive_buffer': 0,
+    'session_idle_timeout': 600,
+    # seconds a stopping or replaced headless process waits for in-flight
+    # transactions before closing the remaining sessions
+    'drain_timeout': 30,
+    # admission control: connections waiting in the kernel and in Qt, inbound
+    # frames and bytes per second per connection and for all of them, and
+    # transactions waiting for an answer. Requests over a limit are answered
+    # "terminal busy", rates and the in-flight cap of 0 are unlimited
+    'listen_backlog': 50,
+    'max_pending_connections': 30,
+    'session_frame_rate': 0,
+    'session_frame_burst': 0,
+    'session_byte_rate': 0,
+    'session_byte_burst': 0,
+    'global_frame_rate': 0,
+    'global_byte_rate': 0,
+    'max_in_flight_transactions': 0,
+    # a TransactionCancelEMV stops the running scenario at once, then the
+    # cancel approval and the canceled TransactionEMV follow after these
+    # delays, 0 sends them right away. scenario_step_delay_ms paces the
+    # simulated card steps of the UI
+    'cancel_approval_delay_ms': 0,
+    'cancel_response_delay_ms': 500,
+    'scenario_step_delay_ms': 500,
+    'terminals': [],
 }
 
 
-def save_config(config: Config):
-    dir = "data"
-    filepath = f"{dir}/config.yaml"
+class ConfigStore:
+    """Loads and persists the config file. Saves are merged over `debounce`
+    seconds and written atomically on a background thread, the file can be
+    watched for external edits which are applied to the loaded config."""
 
-    if not os.path.exists(dir):
-        os.makedirs(dir)
+    def __init__(self, filepath: str, debounce: float = 0.5,
+                 poll_interval: float = 1.0):
+        self.filepath = filepath
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.config: Config | None = None
 
-    with open(filepath, "w") as file:
-        yaml.dump(config_to_dict(config), file)
-        print(f"INFO: Saved config to {filepath}")
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+        self.save_timer: threading.Timer | None = None
+        self.pending_data: dict | None = None
+        self.written_text: str | None = None
+        self.written_stat: tuple | None = None
 
+        self.listeners: list[Callable[[Config], None]] = []
+        self.watch_stop = threading.Event()
+        self.watch_thread: threading.Thread | None = None
 
-def load_config() -> Config:
-    dir = "data"
-    filepath = f"{dir}/config.yaml"
+        atexit.register(self.flush)
+
+    def get(self) -> Config:
+        """Returns the loaded config, reading the file on first use."""
+        if self.config is None:
+            with self.load_lock:
+                if self.config is None:
+                    self.load()
+        return self.config
+
+    def load(self) -> Config:
+        yaml_config: dict | None = None
+        if os.path.exists(self.filepath):
+            with open(self.filepath, 'r') as file:
+                yaml_config = yaml.load(file, Loader=SafeLoader)
+            self.written_stat = self._file_stat()
 
-    if not os.path.exists(dir):
-        os.makedirs(dir)
+        if not yaml_config:
+            print(f'WARN: Config file "{self.filepath}" is missing or empty, \
+                  creating new one using default config')
+            config = dict_to_config(default_config_dict)
+            self.config = config
+            self.save(config)
+            return config
 
-    if not os.path.exists(filepath):
-        with open(filepath, "w") as file:
-            pass
+        print(f'INFO: Loaded config file "{self.filepath}"')
 
-    with open(filepath, 'r') as file:
-        yaml_config: dict = yaml.safe_load(file)
+        original_keys = set(yaml_config.keys())
+        for key, value in default_config_dict.items():
+            yaml_config.setdefault(key, value)
+        new_keys = set(yaml_config.keys()) - original_keys
+
+        config = dict_to_config(yaml_config)
+        self.config = config
+        if new_keys:
+            print(f'WARN: Keys "{new_keys}" are missing from " \
+                {self.filepath}", loading them from default config')
+            self.save(config)
+        else:
+            self.written_text = yaml.dump(config_to_dict(config),
+                                          Dumper=SafeDumper)
 
-    if not yaml_config:
-        print(f'WARN: Config file "{filepath}" is empty, \
-              creating new one using default config')
-        config = dict_to_config(default_config_dict)
-        save_config(config)
         return config
 
-    print(f'INFO: Loaded config file "{filepath}"')
+    def save(self, config: Config):
+        data = config_to_dict(config)
+        with self.lock:
+            self.pending_data = data
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+            self.save_timer = threading.Timer(self.debounce, self.flush)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            data = self.pending_data
+            self.pending_data = None
+            if data is None:
+                return
+
+            text = yaml.dump(data, Dumper=SafeDumper)
+            if text == self.written_text:
+                return
+
+            self._write_atomic(text)
+            self.written_text = text
+            self.written_stat = self._file_stat()
+            print(f"INFO: Saved config to {self.filepath}")
+
+    def _write_atomic(self, text: str):
+        dir = os.path.dirname(self.filepath) or "."
+        os.makedirs(dir, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=dir, prefix=".config.",
+                                        suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as file:
+                file.write(text)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.filepath)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        if hasattr(os, "O_DIRECTORY"):
+            dir_fd = os.open(dir, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def _file_stat(self) -> tuple | None:
+        try:
+            stat = os.stat(self.filepath)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def add_listener(self, listener: Callable[[Config], None]):
+        self.listeners.append(listener)
+
+    def watch(self):
+        """Polls the file mtime and reloads it when edited externally."""
+        if self.watch_thread is not None:
+            return
+
+        self.watch_stop.clear()
+        self.watch_thread = threading.Thread(
+            target=self._watch_loop, name="ConfigWatcher", daemon=True)
+        self.watch_thread.start()
+
+    def stop_watching(self):
+        self.watch_stop.set()
+        if self.watch_thread is not None:
+            self.watch_thread.join()
+            self.watch_thread = None
+
+    def _watch_loop(self):
+        while not self.watch_stop.wait(self.poll_interval):
+            with self.lock:
+                stat = self._file_stat()
+                if stat is None or stat == self.written_stat:
+                    continue
+                self.written_stat = stat
+
+            try:
+                self.reload()
+            except (OSError, yaml.YAMLError) as e:
+                print(f'ERROR: Failed to reload config "{self.filepath}": {e}')
+
+    def reload(self):
+        with open(self.filepath, 'r') as file:
+            yaml_config: dict = yaml.load(file, Loader=SafeLoader) or {}
+
+        for key, value in default_config_dict.items():
+            yaml_config.setdefault(key, value)
+        new_config = dict_to_config(yaml_config)
+
+        with self.lock:
+            self.written_text = yaml.dump(config_to_dict(new_config),
+                                          Dumper=SafeDumper)
+            if self.config is None:
+                self.config = new_config
+            else:
+                # update in place, modules hold a reference to the config
+                for field in fields(Config):
+                    setattr(self.config, field.name,
+                            getattr(new_config, field.name))
+
+        print(f'INFO: Reloaded config file "{self.filepath}"')
+        for listener in self.listeners:
+            listener(self.config)
+
+
+store = ConfigStore("data/config.yaml")
+
+
+def save_config(config: Config):
+    store.save(config)
+
+
+def load_config() -> Config:
+    return store.load()
+
 
-    original_keys = set(yaml_config.keys())
-    for key, value in default_config_dict.items():
-        yaml_config.setdefault(key, value)
-    new_keys = set(yaml_config.keys()) - original_keys
-    if new_keys:
-        print(f'WARN: Keys "{new_keys}" are missing from " \
-            {filepath}", loading them from default config')
-        save_config(dict_to_config(yaml_config))
+def get_config() -> Config:
+    return store.get()
 
-    return dict_to_config(yaml_config)
 
+def get_terminal_profiles(config: Config) -> list[TerminalProfile]:
+    if config.terminals:
+        return config.terminals
 
-config = load_config()
+    return [TerminalProfile(
+        port=config.port if config.tcp_enabled else 0,
+        terminal_id="",
+        card_issuer=config.card_issuer,
+        card_type=config.card_type,
+        card_number=config.card_number,
+        expiration_date=config.expiration_date,
+        cvv=config.cvv,
+        unix_socket_path=config.unix_socket_path,
+        tls_port=config.tls_port,
+    )]
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import shutil
+import socket
+import ssl
+import threading
+
+
+def create_server_context(certificate: str, private_key: str,
+                          session_tickets: int) -> ssl.SSLContext:
+    """One context for every connection, its ticket key lets reconnecting
+    registers resume their session instead of a full handshake."""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(certificate, private_key)
+    context.num_tickets = session_tickets
+    if session_tickets == 0:
+        context.options |= ssl.OP_NO_TICKET
+    return context
+
+
+class TlsProxy:
+    """Terminates TLS on `port` and forwards the plaintext stream of every
+    connection to the server's Unix socket at `backend_path`, in a private
+    directory that is removed on close.
+
+    Qt creates a TLS context per socket, so QSslServer cannot resume
+    sessions; the proxy runs Python's ssl on an asyncio loop in its own
+    thread instead."""
+
+    def __init__(self, port: int, backend_path: str, context: ssl.SSLContext,
+                 descriptor: int | None = None, reuse_port: bool = False):
+        self.port = port
+        self.backend_path = backend_path
+        self.context = context
+        # an already listening socket, taken over from another process
+        self.descriptor = descriptor
+        # SO_REUSEPORT lets worker processes, or the process taking over,
+        # bind the same port
+        self.reuse_port = reuse_port
+        self.sock: socket.socket | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.server: asyncio.AbstractServer | None = None
+        self.started = threading.Event()
+        self.error: OSError | None = None
+        self.handshakes = 0
+        self.resumed = 0
+
+    def start(self) -> bool:
+        threading.Thread(target=self.run, daemon=True,
+                         name=f"TlsProxy{self.port}").start()
+        self.started.wait()
+        if self.error is not None:
+            print(f"ERROR: Could not listen for TLS on port {self.port}: \
+                {self.error}")
+            return False
+        print(f"INFO: Listening for TLS on port {self.port}")
+        return True
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            if self.descriptor is not None:
+                self.sock = socket.socket(fileno=self.descriptor)
+            else:
+                self.sock = socket.create_server(
+                    ("", self.port),
+                    family=socket.AF_INET6 if socket.has_dualstack_ipv6()
+                    else socket.AF_INET,
+                    dualstack_ipv6=socket.has_dualstack_ipv6(),
+                    reuse_port=self.reuse_port)
+            self.server = self.loop.run_until_complete(asyncio.start_server(
+                self.on_connection, sock=self.sock, ssl=self.context))
+        except OSError as e:
+            if self.sock is not None:
+                self.sock.close()
+            self.error = e
+            self.started.set()
+            self.loop.close()
+            return
+        self.started.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    async def on_connection(self, tls_reader: asyncio.StreamReader,
+                            tls_writer: asyncio.StreamWriter):
+        ssl_object = tls_writer.get_extra_info("ssl_object")
+        self.handshakes += 1
+        if ssl_object is not None and ssl_object.session_reused:
+            self.resumed += 1
+
+        try:
+            reader, writer = await asyncio.open_unix_connection(
+                self.backend_path)
+        except OSError as e:
+            print(f"ERROR: TLS backend \"{self.backend_path}\" unavailable: {e}")
+            tls_writer.close()
+            return
+
+        await asyncio.gather(self.pump(tls_reader, writer),
+                             self.pump(reader, tls_writer))
+
+    async def pump(self, reader: asyncio.StreamReader,
+                   writer: asyncio.StreamWriter):
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+        except (OSError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
+
+    def metrics(self) -> dict:
+        return {'tls_handshakes': self.handshakes,
+                'tls_resumed': self.resumed}
+
+    def socket_descriptor(self) -> int:
+        """The listening socket for a handoff, -1 once it is closed."""
+        return self.sock.fileno() if self.sock is not None else -1
+
+    def stop_accepting(self):
+        """Closes the TLS listener, proxied connections keep running."""
+        if self.loop is not None and self.server is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.server.close)
+            except RuntimeError:
+                pass
+
+    def close(self):
+        shutil.rmtree(os.path.dirname(self.backend_path), ignore_errors=True)
+        if self.loop is None or self.loop.is_closed():
+            return
+
+        def stop():
+            if self.server is not None:
+                self.server.close()
+            self.loop.stop()
+        try:
+            self.loop.call_soon_threadsafe(stop)
+        except RuntimeError:
+            pass  # the loop closed in the meantime
@@ -1,6 +1,7 @@
 import os
 import functools
 import time
+from typing import TYPE_CHECKING, Callable
 from PySide6.QtGui import (
     QPainterPath,
     QPixmap,
@@ -15,6 +16,7 @@ from PySide6.QtCore import (
     Qt,
     QTimer,
     QPointF,
+    QRectF,
     Signal,
     Slot,
 )
@@ -34,11 +36,19 @@ from PySide6.QtWidgets import (
     QVBoxLayout,
     QSizePolicy,
     QSpacerItem,
+    QStackedWidget,
 )
 
 from message_generator import TerminalStatusResponseCode, DisplayMessageLevel, TransactionResponseCode
-from terminal_config import config, save_config
-from server import ServerThread
+from terminal_config import CardProfile, get_config, save_config
+from commands import Command, DisplayCommand, StatusCommand, TransactionCommand
+from asset_cache import pixmap_cache
+from update_coalescer import UpdateCoalescer
+from net_info import ip_resolver
+
+# QtNetwork is only needed once the server starts, after the first paint
+if TYPE_CHECKING:
+    from server import ServerThread
 
 
 os.environ["QT_IM_MODULE"] = "qtvirtualkeyboard"
@@ -132,25 +142,58 @@ QRadioButton::indicator:disabled {
 """
 
 
-def getImagePath(name: str) -> str:
-    imagePath = f'assets/images/{name}'
-    if not os.path.exists(imagePath):
-        print(f"ERROR: {imagePath} not found")
-        return ''
-    return imagePath
-
-
 class DiamondButton(QPushButton):
+    STATE_COLORS = {
+        "normal": "white",
+        "hover": "white",
+        "pressed": "white",
+        "disabled": "white",
+    }
+
     def __init__(self, text: str, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.text = text
+        # rendered button per (width, height, device pixel ratio, state)
+        self.cached_pixmaps: dict[tuple, QPixmap] = {}
+
+    def buttonState(self) -> str:
+        if not self.isEnabled():
+            return "disabled"
+        if self.isDown():
+            return "pressed"
+        if self.underMouse():
+            return "hover"
+        return "normal"
+
+    def resizeEvent(self, event):
+        self.cached_pixmaps.clear()
+        super().resizeEvent(event)
 
     def paintEvent(self, _):
+        state = self.buttonState()
+        device_pixel_ratio = self.devicePixelRatioF()
+        key = (self.width(), self.height(), device_pixel_ratio, state)
+
+        pixmap = self.cached_pixmaps.get(key)
+        if pixmap is None:
+            pixmap = self.renderPixmap(state, device_pixel_ratio)
+            self.cached_pixmaps[key] = pixmap
+
         painter = QPainter(self)
-        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.drawPixmap(0, 0, pixmap)
 
+    def renderPixmap(self, state: str, device_pixel_ratio: float) -> QPixmap:
         w, h = self.width(), self.height()
-        pen = QPen(QColor("white"), 4)
+        pixmap = QPixmap(round(w * device_pixel_ratio),
+                         round(h * device_pixel_ratio))
+        pixmap.setDevicePixelRatio(device_pixel_ratio)
+        pixmap.fill(Qt.GlobalColor.transparent)
+
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+
+        color = QColor(self.STATE_COLORS[state])
+        pen = QPen(color, 4)
         painter.setPen(pen)
         painter.setBrush(Qt.BrushStyle.NoBrush)
 
@@ -185,17 +228,18 @@ class DiamondButton(QPushButton):
         painter.drawPath(path)
 
         # Draw the text
-        painter.setPen(QColor("white"))
+        painter.setPen(color)
         painter.setFont(QFont("Kulim Park", 20))
         painter.drawText(
-            self.rect(), Qt.AlignmentFlag.AlignCenter, self.text)
+            QRectF(0, 0, w, h), Qt.AlignmentFlag.AlignCenter, self.text)
+
+        painter.end()
+        return pixmap
 
 
 class MainWindow(QMainWindow):
-    pay_button_clicked = Signal(dict)
-    send_status_signal = Signal(TerminalStatusResponseCode)
-    send_display_signal = Signal(str, int, DisplayMessageLevel)
-    send_transaction_signal = Signal(TransactionResponseCode, dict)
+    config_reloaded = Signal()
+    first_painted = Signal()
 
     def __init__(self):
         super().__init__()
@@ -206,18 +250,29 @@ class MainWindow(QMainWindow):
         self.setStyleSheet(STYLESHEET)
         self.setWindowState(Qt.WindowState.WindowFullScreen)
         self.setCursor(Qt.CursorShape.BlankCursor)
-        self.card_details: dict
-        self.price_text_value: str
+        self.card_details: CardProfile | None = None
+        self.price_text_value: str = ""
         self.sent_message: str = ""
 
-        self.server_thread: ServerThread | None = None
-
-        self.send_status_signal_message_handler = lambda code: self.update_sent_message(
-            code._name_.replace("_", " "))
-        self.send_display_signal_message_handler = lambda msg, _, __: self.update_sent_message(
-            msg)
-        self.send_transaction_signal_message_handler = lambda code, _: self.update_sent_message(
-            code._name_.replace("_", " "))
+        # screens are built once and switched in the stack, only the
+        # labels below are updated on transitions
+        self.stack = QStackedWidget()
+        self.setCentralWidget(self.stack)
+        self.screens: dict[str, QWidget] = {}
+        self.price_labels: list[QLabel] = []
+        self.sent_message_labels: list[QLabel] = []
+
+        # bursts from the server thread are applied once per frame
+        self.coalescer = UpdateCoalescer(parent=self)
+        # pending steps of the simulated payment, stopped on cancellation
+        self.scenario_timers: set[QTimer] = set()
+
+        self.server_thread: "ServerThread | None" = None
+        self.ip: str = ""
+        self.first_paint_done = False
+
+        self.config_reloaded.connect(self.on_config_reloaded)
+        ip_resolver.ip_changed.connect(self.on_ip_changed)
         # Set the initial screen
         self.showIdleScreen()
 
@@ -228,12 +283,9 @@ class MainWindow(QMainWindow):
         layout.setContentsMargins(20, 20, 20, 20)
         layout.setSpacing(0)
 
-        logo_path = getImagePath('sb_logo.png')
-        settings_image_path = getImagePath('settings.png')
-
         # settings button
         settings_button = QPushButton()
-        settings_icon = QPixmap(settings_image_path)
+        settings_icon = pixmap_cache.pixmap('settings.png')
         settings_button.clicked.connect(self.showSettingsScreen)
 
         settings_button.setIcon(settings_icon)
@@ -243,7 +295,7 @@ class MainWindow(QMainWindow):
 
         # logo label
         big_logo = QLabel()
-        big_logo.setPixmap(QPixmap(logo_path).scaledToWidth(375))
+        big_logo.setPixmap(pixmap_cache.pixmap('sb_logo.png', 375))
         big_logo.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
         layout.addWidget(
@@ -266,9 +318,8 @@ class MainWindow(QMainWindow):
 
         # Back Button
         back_button_layout = QHBoxLayout()
-        settings_image_path = getImagePath('back_arrow.png')
         back_button = QPushButton()
-        settings_icon = QPixmap(settings_image_path)
+        settings_icon = pixmap_cache.pixmap('back_arrow.png')
         back_button.setIcon(settings_icon)
         back_button.setIconSize(QSize(64, 64))
         back_button.setFixedSize(64, 64)
@@ -286,26 +337,24 @@ class MainWindow(QMainWindow):
         card_group.setStyleSheet("QGroupBox { color: white; }")
         card_layout = QVBoxLayout()
 
-        self.card_number_input_settings = QLineEdit(config.card_number)
+        self.card_number_input_settings = QLineEdit()
         self.card_number_input_settings.setPlaceholderText("Card Number")
         card_layout.addWidget(self.card_number_input_settings)
 
         x = QHBoxLayout()
         exp_layout = QHBoxLayout()
-        self.exp_month_settings = QLineEdit(
-            config.expiration_date[:2])
+        self.exp_month_settings = QLineEdit()
         self.exp_month_settings.setPlaceholderText("MM")
         self.exp_month_settings.setFixedWidth(50)
         exp_layout.addWidget(self.exp_month_settings)
 
-        self.exp_year_settings = QLineEdit(
-            config.expiration_date[2:])
+        self.exp_year_settings = QLineEdit()
         self.exp_year_settings.setPlaceholderText("YY")
         self.exp_year_settings.setFixedWidth(50)
         exp_layout.addWidget(self.exp_year_settings)
 
         cvv_layout = QHBoxLayout()
-        self.cvv_input_settings = QLineEdit(config.cvv)
+        self.cvv_input_settings = QLineEdit()
         self.cvv_input_settings.setPlaceholderText("CVV")
         self.cvv_input_settings.setFixedWidth(60)
         cvv_layout.addWidget(self.cvv_input_settings)
@@ -320,10 +369,10 @@ class MainWindow(QMainWindow):
 
         network_group.setStyleSheet("QGroupBox { color: white; }")
         network_layout = QHBoxLayout()
-        self.ip_addres_input = QLineEdit(self.ip)
+        self.ip_addres_input = QLineEdit()
         self.ip_addres_input.setEnabled(False)
         self.ip_addres_input.setStyleSheet("color: #aaaaaa")
-        self.port_input = QLineEdit(str(config.port))
+        self.port_input = QLineEdit()
         self.port_input.setValidator(QIntValidator(1, 65535))
         network_layout.addWidget(self.ip_addres_input)
         network_layout.addWidget(self.port_input)
@@ -332,13 +381,23 @@ class MainWindow(QMainWindow):
 
         # Toggle
         self.send_response_toggle = QCheckBox("Send Response")
-        self.send_response_toggle.setChecked(config.send_rsp_before_timeout)
         layout.addWidget(self.send_response_toggle)
 
         layout.addStretch()
 
         return widget
 
+    def refreshSettingsScreen(self):
+        """Loads the current config values into the settings fields."""
+        config = get_config()
+        self.card_number_input_settings.setText(config.card_number)
+        self.exp_month_settings.setText(config.expiration_date[:2])
+        self.exp_year_settings.setText(config.expiration_date[2:])
+        self.cvv_input_settings.setText(config.cvv)
+        self.ip_addres_input.setText(self.ip)
+        self.port_input.setText(str(config.port))
+        self.send_response_toggle.setChecked(config.send_rsp_before_timeout)
+
     def createPaymentScreen(self):
         widget = QWidget()
         layout = QGridLayout(widget)
@@ -349,7 +408,7 @@ class MainWindow(QMainWindow):
         topLayout = QHBoxLayout()
         topLayout.addStretch()
         text_logo = QLabel()
-        pixmap = QPixmap(getImagePath('text_logo.png'))
+        pixmap = pixmap_cache.pixmap('text_logo.png')
         text_logo.setPixmap(pixmap)
         text_logo.setFixedHeight(50)
         topLayout.addWidget(text_logo)
@@ -372,6 +431,7 @@ class MainWindow(QMainWindow):
         mainContent.addWidget(title)
 
         price_text = QLabel(self.price_text_value)
+        self.price_labels.append(price_text)
         price_text.setFont(QFont("Kulim Park", 30))
         price_text.setStyleSheet(
             "color: white; font-weight: semibold; margin-left: 10px;")
@@ -452,7 +512,7 @@ class MainWindow(QMainWindow):
     #     topLayout = QHBoxLayout()
     #     topLayout.addStretch()
     #     text_logo = QLabel()
-    #     pixmap = QPixmap(getImagePath('text_logo.png'))
+    #     pixmap = pixmap_cache.pixmap('text_logo.png')
     #     text_logo.setPixmap(pixmap)
     #     text_logo.setFixedHeight(50)
     #     topLayout.addWidget(text_logo)
@@ -587,7 +647,7 @@ class MainWindow(QMainWindow):
         topLayout = QHBoxLayout()
         topLayout.addStretch()
         text_logo = QLabel()
-        pixmap = QPixmap(getImagePath('text_logo.png'))
+        pixmap = pixmap_cache.pixmap('text_logo.png')
         text_logo.setPixmap(pixmap)
         text_logo.setFixedHeight(50)
         topLayout.addWidget(text_logo)
@@ -611,19 +671,21 @@ class MainWindow(QMainWindow):
         mainContent.addWidget(title)
 
         price_text = QLabel(self.price_text_value)
+        self.price_labels.append(price_text)
         price_text.setFont(QFont("Kulim Park", 30))
         price_text.setStyleSheet(
             "color: white; font-weight: semibold; margin-left: 10px;")
         price_text.setAlignment(Qt.AlignmentFlag.AlignLeft)
         mainContent.addWidget(price_text)
 
-        self.sent_message_text = QLabel(self.sent_message)
-        self.sent_message_text.setWordWrap(True)
-        self.sent_message_text.setAlignment(Qt.AlignmentFlag.AlignLeft)
-        self.sent_message_text.setFont(QFont("Kulim Park", 30))
-        self.sent_message_text.setStyleSheet(
+        sent_message_text = QLabel(self.sent_message)
+        sent_message_text.setWordWrap(True)
+        sent_message_text.setAlignment(Qt.AlignmentFlag.AlignLeft)
+        sent_message_text.setFont(QFont("Kulim Park", 30))
+        sent_message_text.setStyleSheet(
             "color: white; font-weight: semibold; margin-left: 10px;")
-        mainContent.addWidget(self.sent_message_text)
+        mainContent.addWidget(sent_message_text)
+        self.sent_message_labels.append(sent_message_text)
 
         mainContent.addSpacerItem(QSpacerItem(
             20, 40, QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Expanding))
@@ -641,7 +703,7 @@ class MainWindow(QMainWindow):
         topLayout = QHBoxLayout()
         topLayout.addStretch()
         text_logo = QLabel()
-        pixmap = QPixmap(getImagePath('text_logo.png'))
+        pixmap = pixmap_cache.pixmap('text_logo.png')
         text_logo.setPixmap(pixmap)
         text_logo.setFixedHeight(50)
         topLayout.addWidget(text_logo)
@@ -665,19 +727,21 @@ class MainWindow(QMainWindow):
         mainContent.addWidget(title)
 
         price_text = QLabel(self.price_text_value)
+        self.price_labels.append(price_text)
         price_text.setFont(QFont("Kulim Park", 30))
         price_text.setStyleSheet(
             "color: white; font-weight: semibold; margin-left: 10px;")
         price_text.setAlignment(Qt.AlignmentFlag.AlignLeft)
         mainContent.addWidget(price_text)
 
-        self.sent_message_text = QLabel(self.sent_message)
-        self.sent_message_text.setWordWrap(True)
-        self.sent_message_text.setAlignment(Qt.AlignmentFlag.AlignLeft)
-        self.sent_message_text.setFont(QFont("Kulim Park", 30))
-        self.sent_message_text.setStyleSheet(
+        sent_message_text = QLabel(self.sent_message)
+        sent_message_text.setWordWrap(True)
+        sent_message_text.setAlignment(Qt.AlignmentFlag.AlignLeft)
+        sent_message_text.setFont(QFont("Kulim Park", 30))
+        sent_message_text.setStyleSheet(
             "color: white; font-weight: semibold; margin-left: 10px;")
-        mainContent.addWidget(self.sent_message_text)
+        mainContent.addWidget(sent_message_text)
+        self.sent_message_labels.append(sent_message_text)
 
         mainContent.addSpacerItem(QSpacerItem(
             20, 40, QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Expanding))
@@ -915,171 +979,216 @@ class MainWindow(QMainWindow):
         level_index = self.display_message_level_dropdown.currentIndex()
         level = self.display_message_level_options[level_index][1]
 
-        self.send_display_signal.emit(message, numeric_value, level)
+        self.sendDisplay(message, numeric_value, level)
 
     def execute_selected_terminal_status(self):
         selected_index = self.terminal_status_dropdown.currentIndex()
         selected_option = self.terminal_status_response_options[selected_index]
 
-        self.send_status_signal.emit(selected_option[1])
+        self.sendStatus(selected_option[1])
 
     def execute_selected_transaction_response(self):
         selected_index = self.transaction_response_dropdown.currentIndex()
         selected_option = self.transaction_response_options[selected_index]
 
-        self.send_transaction_signal.emit(
+        self.sendTransaction(
             selected_option[1], self.card_details)
 
+    def sendCommand(self, command: Command) -> bool:
+        """Queues a command for the connection handler's thread."""
+        if self.server_thread is None:
+            print("ERROR: No server thread")
+            return False
+        return self.server_thread.connection_handler.commands.put(command)
+
+    def sendStatus(self, status_code: TerminalStatusResponseCode):
+        if self.sendCommand(StatusCommand(status_code)):
+            self.update_sent_message(status_code.name.replace("_", " "))
+
+    def sendDisplay(self, text: str, message_code: int, message_level: DisplayMessageLevel):
+        if self.sendCommand(DisplayCommand(text, message_code, message_level)):
+            self.update_sent_message(text)
+
+    def sendTransaction(self, response_code: TransactionResponseCode, card: CardProfile | None):
+        if self.sendCommand(TransactionCommand(response_code, card)):
+            self.update_sent_message(response_code.name.replace("_", " "))
+
     def update_sent_message(self, message: str):
+        self.coalescer.schedule(
+            "sent_message", self.applySentMessage, message)
+
+    def applySentMessage(self, message: str):
         self.sent_message = message
-        self.sent_message_text.setText(self.sent_message)
+        for label in self.sent_message_labels:
+            label.setText(self.sent_message)
+
+    def scheduleStep(self, step: Callable[[], None]):
+        timer = QTimer(self)
+        timer.setSingleShot(True)
+        timer.timeout.connect(functools.partial(self.runStep, timer, step))
+        self.scenario_timers.add(timer)
+        timer.start(get_config().scenario_step_delay_ms)
+
+    def runStep(self, timer: QTimer, step: Callable[[], None]):
+        self.scenario_timers.discard(timer)
+        timer.deleteLater()
+        step()
+
+    def cancelScenario(self):
+        """Stops every pending step of the simulated payment."""
+        for timer in self.scenario_timers:
+            timer.stop()
+            timer.deleteLater()
+        self.scenario_timers.clear()
+        self.showIdleScreen()
 
     def handleSimulatedPayButtonClicked(self, step: int = 0):
         if step == 0:
-            self.send_status_signal.emit(
+            self.sendStatus(
                 TerminalStatusResponseCode.INSERT_CARD)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=1))
         elif step == 1:
-            self.send_display_signal.emit(
+            self.sendDisplay(
                 "4,00 Insert card",
                 1,
                 DisplayMessageLevel.INFO)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=2))
         elif step == 2:
-            self.send_status_signal.emit(
+            self.sendStatus(
                 TerminalStatusResponseCode.CARD_INSERTED)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=3))
         elif step == 3:
-            self.send_display_signal.emit(
+            self.sendDisplay(
                 "Please wait",
                 2,
                 DisplayMessageLevel.INFO)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=4))
         elif step == 4:
-            self.send_status_signal.emit(
+            self.sendStatus(
                 TerminalStatusResponseCode.CARD_IDENTIFICATION)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=5))
         elif step == 5:
-            self.send_status_signal.emit(
+            self.sendStatus(
                 TerminalStatusResponseCode.CHIP_CARD_ACCEPTED)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=6))
         elif step == 6:
-            self.send_display_signal.emit(
+            self.sendDisplay(
                 "Credit Card Amex",
                 3,
                 DisplayMessageLevel.INFO)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=7))
         elif step == 7:
-            self.send_status_signal.emit(
+            self.sendStatus(
                 TerminalStatusResponseCode.ENTER_PIN)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=8))
         elif step == 8:
-            self.send_display_signal.emit(
+            self.sendDisplay(
                 "4,00 $ Enter PIN",
                 10,
                 DisplayMessageLevel.INFO)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=9))
         elif step == 9:
-            self.send_display_signal.emit(
+            self.sendDisplay(
                 "*   ",
                 11,
                 DisplayMessageLevel.INFO)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=10))
         elif step == 10:
-            self.send_display_signal.emit(
+            self.sendDisplay(
                 "**  ",
                 12,
                 DisplayMessageLevel.INFO)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=11))
         elif step == 11:
-            self.send_display_signal.emit(
+            self.sendDisplay(
                 "*** ",
                 13,
                 DisplayMessageLevel.INFO)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=12))
         elif step == 12:
-            self.send_display_signal.emit(
+            self.sendDisplay(
                 "****",
                 14,
                 DisplayMessageLevel.INFO)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=13))
         elif step == 13:
-            self.send_status_signal.emit(
+            self.sendStatus(
                 TerminalStatusResponseCode.PIN_ACCEPTED)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=14))
         elif step == 14:
-            self.send_status_signal.emit(
+            self.sendStatus(
                 TerminalStatusResponseCode.AUTHORIZATION_PROCESSING)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=15))
         elif step == 15:
-            self.send_display_signal.emit(
+            self.sendDisplay(
                 "Please wait",
                 1,
                 DisplayMessageLevel.INFO)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=16))
         elif step == 16:
-            self.send_status_signal.emit(
+            self.sendStatus(
                 TerminalStatusResponseCode.AUTHORIZATION_APPROVED)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=17))
         elif step == 17:
-            self.send_display_signal.emit(
+            self.sendDisplay(
                 "Accepted Take card",
                 100,
                 DisplayMessageLevel.INFO)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=18))
         elif step == 18:
-            self.send_status_signal.emit(
+            self.sendStatus(
                 TerminalStatusResponseCode.CARD_REMOVED)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=19))
         elif step == 19:
-            self.send_transaction_signal.emit(
+            self.sendTransaction(
                 TransactionResponseCode.AUTHORISED,
                 self.card_details
             )
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleSimulatedPayButtonClicked, step=20))
 
     def handleQuickPayButtonClicked(self, step: int = 0):
         if step == 0:
-            self.send_status_signal.emit(
+            self.sendStatus(
                 TerminalStatusResponseCode.CARD_INSERTED)
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleQuickPayButtonClicked, step=1))
         elif step == 1:
-            self.send_transaction_signal.emit(
+            self.sendTransaction(
                 TransactionResponseCode.AUTHORISED,
                 self.card_details
             )
-            QTimer.singleShot(500, functools.partial(
+            self.scheduleStep(functools.partial(
                 self.handleQuickPayButtonClicked, step=2))
 
     def load_card_details(self):
-        global config
-        self.card_details = {
-            "card_number": config.card_number,
-            "expiration_date": config.expiration_date,
-            "cvv": config.cvv,
-            "card_issuer": config.card_issuer
-        }
+        config = get_config()
+        self.card_details = CardProfile(
+            card_number=config.card_number,
+            expiration_date=config.expiration_date,
+            cvv=config.cvv,
+            card_issuer=config.card_issuer,
+            card_type=config.card_type
+        )
         print(f"INFO: Saved card details:\n {self.card_details}")
 
     # def handleManualPayButtonClicked(self):
@@ -1092,7 +1201,7 @@ class MainWindow(QMainWindow):
     #     print(f"INFO: Saved card details:\n {self.card_details}")
 
     def saveSettings(self):
-        global config
+        config = get_config()
 
         port = int(self.port_input.text()
                    ) if self.port_input.text().isdigit() else 0
@@ -1108,68 +1217,100 @@ class MainWindow(QMainWindow):
         config.expiration_date = expiration
 
         save_config(config)
+        # a changed port is picked up by relistening, the ECR connection
+        # stays up
+        self.on_config_reloaded()
 
         print("INFO: Settings saved")
 
-    def showSettingsScreen(self):
-        """Switches to the settings screen."""
+    def on_ip_changed(self, ip: str):
+        self.ip = ip
+        if "settings" in self.screens:
+            self.ip_addres_input.setText(ip)
+
+    def on_config_reloaded(self):
         if self.server_thread and self.server_thread.isRunning():
-            self.server_thread.stop()
-            try:
-                self.server_thread.connection_handler.price_updated.disconnect(
-                    self.showPaymentScreen)
-                self.server_thread.connection_handler.client_disconnected.disconnect(
-                    self.showIdleScreen)
-                self.pay_button_clicked.disconnect(
-                    self.server_thread.connection_handler.send_payment)
-                self.send_status_signal.disconnect(
-                    self.server_thread.connection_handler.recieve_status_from_ui)
-                self.send_display_signal.disconnect(
-                    self.server_thread.connection_handler.recieve_display_from_ui)
-                self.send_transaction_signal.disconnect(
-                    self.server_thread.connection_handler.recieve_transaction_response_from_ui)
-            except TypeError:
-                pass
-            self.server_thread = None
+            self.server_thread.apply_config(get_config())
 
-        self.setCentralWidget(self.createSettingsScreen())
+    def showSettingsScreen(self):
+        """Switches to the settings screen, the server keeps running and
+        saved settings are applied to it live."""
+        self.showScreen("settings", self.createSettingsScreen)
+        self.refreshSettingsScreen()
+
+    def getScreen(self, name: str, create_screen) -> QWidget:
+        """Returns the named screen, building it on first use."""
+        screen = self.screens.get(name)
+        if screen is None:
+            screen = create_screen()
+            self.screens[name] = screen
+            self.stack.addWidget(screen)
+        return screen
+
+    def showScreen(self, name: str, create_screen):
+        # a direct switch wins over a payment screen still waiting to apply
+        if name != "payment":
+            self.coalescer.discard("payment")
+        self.stack.setCurrentWidget(self.getScreen(name, create_screen))
+
+    def buildScreens(self):
+        """Builds the remaining screens ahead of the first transaction."""
+        for name, create_screen in (
+            ("payment", self.createPaymentScreen),
+            ("simple_payment", self.createSimplePaymentScreen),
+            ("manual_payment", self.createManualPaymentScreen),
+            ("settings", self.createSettingsScreen),
+        ):
+            self.getScreen(name, create_screen)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.first_paint_done:
+            self.first_paint_done = True
+            self.first_painted.emit()
+            # start the server once the idle screen is on screen
+            QTimer.singleShot(0, self.startServerThread)
+            QTimer.singleShot(0, self.buildScreens)
+
+    def startServerThread(self):
+        if not self.isVisible():
+            return
 
-    def showIdleScreen(self):
-        """Switches to the main idle screen."""
-        global config
+        config = get_config()
 
         if not self.server_thread:
+            from server import ServerThread
+
             self.server_thread = ServerThread(
                 config.port, self)
             self.server_thread.connection_handler.price_updated.connect(
-                self.showPaymentScreen)
+                self.queuePaymentScreen)
             self.server_thread.connection_handler.client_disconnected.connect(
                 self.showIdleScreen)
-            self.pay_button_clicked.connect(
-                self.server_thread.connection_handler.send_payment)
-            self.send_status_signal.connect(
-                self.server_thread.connection_handler.recieve_status_from_ui)
-            self.send_display_signal.connect(
-                self.server_thread.connection_handler.recieve_display_from_ui)
-            self.send_transaction_signal.connect(
-                self.server_thread.connection_handler.recieve_transaction_response_from_ui)
-            self.send_status_signal.connect(
-                self.send_status_signal_message_handler)
-            self.send_display_signal.connect(
-                self.send_display_signal_message_handler)
-            self.send_transaction_signal.connect(
-                self.send_transaction_signal_message_handler)
+            self.server_thread.connection_handler.transaction_canceled.connect(
+                self.cancelScenario)
 
             self.server_thread.start()
 
-            self.ip = self.server_thread.get_ip()
+        ip_resolver.start()
+        self.ip = ip_resolver.ip
+
+    def showIdleScreen(self):
+        """Switches to the main idle screen."""
+        if self.first_paint_done:
+            self.startServerThread()
+
+        self.showScreen("idle", self.createIdleScreen)
 
-        self.setCentralWidget(self.createIdleScreen())
+    def queuePaymentScreen(self, price: str):
+        self.coalescer.schedule("payment", self.showPaymentScreen, price)
 
     def showPaymentScreen(self, price: str):
         """Switches to the payment screen."""
         self.price_text_value = price
-        self.setCentralWidget(self.createPaymentScreen())
+        for label in self.price_labels:
+            label.setText(price)
+        self.showScreen("payment", self.createPaymentScreen)
 
     # def showManualCardDetailsScreen(self):
     #     """Switches to the manual card details screen."""
@@ -1181,7 +1322,7 @@ class MainWindow(QMainWindow):
             print("ERROR: No server thread")
             return
 
-        self.setCentralWidget(self.createSimplePaymentScreen())
+        self.showScreen("simple_payment", self.createSimplePaymentScreen)
 
     def showManualPaymentScreen(self):
         """Switches to the messages screen."""
@@ -1189,7 +1330,7 @@ class MainWindow(QMainWindow):
             print("ERROR: No server thread")
             return
 
-        self.setCentralWidget(self.createManualPaymentScreen())
+        self.showScreen("manual_payment", self.createManualPaymentScreen)
 
     def closeEvent(self, event):
         """Ensures the server thread is stopped when the window is closed."""
@@ -1197,23 +1338,11 @@ class MainWindow(QMainWindow):
             self.server_thread.stop()
             try:
                 self.server_thread.connection_handler.price_updated.disconnect(
-                    self.showPaymentScreen)
+                    self.queuePaymentScreen)
                 self.server_thread.connection_handler.client_disconnected.disconnect(
                     self.showIdleScreen)
-                self.pay_button_clicked.disconnect(
-                    self.server_thread.connection_handler.send_payment)
-                self.send_status_signal.disconnect(
-                    self.server_thread.connection_handler.recieve_status_from_ui)
-                self.send_display_signal.disconnect(
-                    self.server_thread.connection_handler.recieve_display_from_ui)
-                self.send_transaction_signal.disconnect(
-                    self.server_thread.connection_handler.recieve_transaction_response_from_ui)
-                self.send_status_signal.disconnect(
-                    self.send_status_signal_message_handler)
-                self.send_display_signal.disconnect(
-                    self.send_display_signal_message_handler)
-                self.send_transaction_signal.disconnect(
-                    self.send_transaction_signal_message_handler)
+                self.server_thread.connection_handler.transaction_canceled.disconnect(
+                    self.cancelScenario)
             except TypeError:
                 pass
         event.accept()
@@ -0,0 +1,30 @@
+from typing import Callable
+
+from PySide6.QtCore import QObject, QTimer
+
+
+class UpdateCoalescer(QObject):
+    """Collects UI updates by key and applies only the latest one for each
+    key, at most once per `interval_ms` (one frame by default)."""
+
+    def __init__(self, interval_ms: int = 16, parent: QObject | None = None):
+        super().__init__(parent)
+        self.pending: dict[str, tuple[Callable, tuple]] = {}
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.flush)
+
+    def schedule(self, key: str, apply: Callable, *args):
+        self.pending[key] = (apply, args)
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def discard(self, key: str):
+        self.pending.pop(key, None)
+
+    def flush(self):
+        pending = self.pending
+        self.pending = {}
+        for apply, args in pending.values():
+            apply(*args)
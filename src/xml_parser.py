@@ -1,6 +1,12 @@
+import re
 import xml.etree.ElementTree as ET
 import xml.dom.minidom
 
+_NEEDS_ESCAPE = re.compile(r'[&<>"\r]')
+# minidom stopped escaping quotes in text nodes in Python 3.13
+_ESCAPE_QUOTES = "&quot;" in xml.dom.minidom.parseString(
+    '<a>"</a>').documentElement.toxml()
+
 class XMLParser:
     @staticmethod
     def parse(xml_string: str) -> dict:
@@ -58,6 +64,49 @@ class XMLParser:
         raw_xml = ET.tostring(root_element, encoding="utf-8")
         parsed_xml = xml.dom.minidom.parseString(raw_xml)
         return parsed_xml.toprettyxml(indent="  ")
+
+    @staticmethod
+    def dict_to_xml_fast(data: dict) -> str:
+        """Same output as dict_to_xml, written directly instead of
+        round tripping through ElementTree and minidom."""
+        if not isinstance(data, dict) or len(data) != 1:
+            raise ValueError(
+                "Input dictionary must have exactly one root element.")
+
+        lines = ['<?xml version="1.0" ?>\n']
+        XMLParser._write_element(lines, *next(iter(data.items())), "")
+        return "".join(lines)
+
+    @staticmethod
+    def _write_element(lines: list, name: str, value, indent: str):
+        if isinstance(value, dict):
+            if not value:
+                lines.append(f"{indent}<{name}/>\n")
+                return
+            lines.append(f"{indent}<{name}>\n")
+            child_indent = indent + "  "
+            for k, v in value.items():
+                XMLParser._write_element(lines, k, v, child_indent)
+            lines.append(f"{indent}</{name}>\n")
+            return
+
+        text = str(value)
+        if not text:
+            lines.append(f"{indent}<{name}/>\n")
+            return
+        if _NEEDS_ESCAPE.search(text):
+            text = XMLParser.escape_text(text)
+        lines.append(f"{indent}<{name}>{text}</{name}>\n")
+
+    @staticmethod
+    def escape_text(text: str) -> str:
+        # the parser in dict_to_xml normalizes line endings
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        text = text.replace("&", "&amp;").replace("<", "&lt;").replace(
+            ">", "&gt;")
+        if _ESCAPE_QUOTES:
+            text = text.replace('"', "&quot;")
+        return text
     
     
 
@@ -0,0 +1,43 @@
+import os
+import socket
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+
+@pytest.fixture(scope="session")
+def app():
+    from PySide6.QtCore import QCoreApplication
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture(autouse=True)
+def config(monkeypatch):
+    """Default config, never read from or saved to data/config.yaml."""
+    import terminal_config
+    config = terminal_config.dict_to_config(
+        dict(terminal_config.default_config_dict))
+    monkeypatch.setattr(terminal_config.store, "config", config)
+    monkeypatch.setattr(terminal_config.store, "save",
+                        lambda *args, **kwargs: None)
+    return config
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until(app, predicate, timeout: float = 5.0) -> bool:
+    """Runs the event loop until `predicate` holds or `timeout` runs out."""
+    from PySide6.QtCore import QEventLoop
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        app.processEvents(QEventLoop.ProcessEventsFlag.AllEvents, 50)
+    return True
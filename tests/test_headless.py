@@ -0,0 +1,29 @@
+import json
+
+import pytest
+
+pytest.importorskip("PySide6")
+
+import headless  # noqa: E402
+import outbound  # noqa: E402
+import server  # noqa: E402
+from supervisor import METRICS_PREFIX  # noqa: E402
+
+
+def test_report_metrics_includes_derived_metrics(monkeypatch, capsys):
+    monkeypatch.setattr(outbound, "stats", {
+        'idle': {'sent': 4, 'missed': 1},
+        'busy': {'sent': 0, 'missed': 0},
+    })
+    monkeypatch.setattr(server, "cancel_stats",
+                        {'cancels': 2, 'total_ms': 30.0, 'max_ms': 20.0})
+
+    headless.report_metrics([])
+
+    line = capsys.readouterr().out.strip()
+    assert line.startswith(METRICS_PREFIX)
+    metrics = json.loads(line[len(METRICS_PREFIX):])
+    assert metrics['outbound_idle_sent'] == 4
+    assert metrics['outbound_idle_miss_rate'] == 0.25
+    assert metrics['outbound_busy_miss_rate'] == 0.0
+    assert metrics['cancel_latency_avg_ms'] == 15.0
@@ -0,0 +1,90 @@
+import socket
+import time
+
+import pytest
+
+pytest.importorskip("PySide6")
+
+from conftest import free_port, wait_until  # noqa: E402
+from server import ServerThread, TerminalListener  # noqa: E402
+from terminal_config import TerminalProfile  # noqa: E402
+
+
+def make_listener(port: int) -> TerminalListener:
+    listener = TerminalListener(TerminalProfile(
+        port=port, terminal_id="T0000001", card_issuer="VS",
+        card_type="CHIP", card_number="**********1234",
+        expiration_date="2512", cvv="353"))
+    assert listener.listen()
+    return listener
+
+
+def test_drain_closes_connected_idle_session(app):
+    port = free_port()
+    listener = make_listener(port)
+    client = socket.create_connection(("127.0.0.1", port), timeout=5)
+    try:
+        assert wait_until(app, lambda: listener.sessions)
+
+        listener.drain()
+
+        assert listener.drained()
+        assert client.recv(1) == b""
+    finally:
+        client.close()
+        listener.close()
+
+
+REQUEST = (b"\x02<?xml version=\"1.0\" ?><TransactionEMV>"
+           b"<MerchantTransactionID>7</MerchantTransactionID>"
+           b"<ZRNumber>1</ZRNumber><DeviceNumber>1</DeviceNumber>"
+           b"<DeviceType>1</DeviceType><TerminalID>T0000001</TerminalID>"
+           b"<TransactionType>PURCHASE</TransactionType>"
+           b"<TransactionAmount>4.00</TransactionAmount>"
+           b"<CurrencyCode>EUR</CurrencyCode></TransactionEMV>\x03")
+
+
+def test_idle_reaper_spares_pending_transaction(app, config):
+    config.session_idle_timeout = 1
+    config.headless_response_delay_ms = 2500
+    port = free_port()
+    listener = make_listener(port)
+    client = socket.create_connection(("127.0.0.1", port), timeout=5)
+    client.setblocking(False)
+    received = bytearray()
+
+    def answered():
+        try:
+            received.extend(client.recv(65536))
+        except BlockingIOError:
+            pass
+        return b"<ResponseCode>000</ResponseCode>" in received
+
+    try:
+        client.sendall(REQUEST)
+        assert wait_until(app, answered, timeout=5.0)
+        assert listener.sessions
+    finally:
+        client.close()
+        listener.close()
+
+
+def test_server_thread_sets_session_up_in_its_thread(app):
+    port = free_port()
+    thread = ServerThread(port)
+    thread.start()
+    try:
+        client = None
+        deadline = time.monotonic() + 5.0
+        while client is None:
+            try:
+                client = socket.create_connection(("127.0.0.1", port))
+            except ConnectionRefusedError:
+                assert time.monotonic() < deadline
+                time.sleep(0.05)
+        handler = thread.connection_handler
+        # a timer started from another thread stays inactive
+        assert wait_until(app, lambda: handler.session_idle_timer.isActive())
+        client.close()
+    finally:
+        thread.stop()
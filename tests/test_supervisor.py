@@ -0,0 +1,39 @@
+import json
+import sys
+
+import pytest
+
+pytest.importorskip("PySide6")
+
+from supervisor import METRICS_PREFIX, Supervisor  # noqa: E402
+
+
+def report(metrics: dict) -> list[str]:
+    return [sys.executable, "-c",
+            f"print({METRICS_PREFIX + json.dumps(metrics)!r})"]
+
+
+def run_to_exit(worker):
+    worker.process.wait()
+    worker.output_thread.join(5.0)
+
+
+def test_totals_stay_monotonic_across_worker_restarts():
+    supervisor = Supervisor(workers=1, restart_delay=0)
+    worker = supervisor.workers[0]
+    worker.args = report({'transactions': 5, 'sessions': 2,
+                          'cancel_latency_max_ms': 9.0})
+    worker.start()
+    run_to_exit(worker)
+    assert supervisor.aggregate_metrics()['transactions'] == 5
+
+    worker.args = report({'transactions': 3, 'sessions': 1,
+                          'cancel_latency_max_ms': 4.0})
+    supervisor.check_worker(worker)
+    run_to_exit(worker)
+
+    totals = supervisor.aggregate_metrics()
+    assert totals['restarts'] == 1
+    assert totals['transactions'] == 8
+    assert totals['sessions'] == 1
+    assert totals['cancel_latency_max_ms'] == 9.0
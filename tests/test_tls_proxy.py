@@ -0,0 +1,43 @@
+import os
+import socket
+import stat
+import subprocess
+
+import pytest
+
+pytest.importorskip("PySide6")
+
+from PySide6.QtNetwork import QLocalServer  # noqa: E402
+
+from server import start_tls_proxy  # noqa: E402
+
+
+@pytest.fixture
+def tls_config(config, tmp_path):
+    config.tls_certificate = str(tmp_path / "certificate.pem")
+    config.tls_private_key = str(tmp_path / "key.pem")
+    try:
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+             "-keyout", config.tls_private_key,
+             "-out", config.tls_certificate, "-days", "1",
+             "-subj", "/CN=localhost"],
+            check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        pytest.skip(f"could not create a certificate with openssl: {e}")
+    return config
+
+
+def test_backend_socket_is_private_and_removed_on_close(app, tls_config):
+    server = QLocalServer()
+    proxy = start_tls_proxy(server, 0, tls_config)
+    assert proxy is not None
+    backend_dir = os.path.dirname(proxy.backend_path)
+    try:
+        assert stat.S_IMODE(os.stat(backend_dir).st_mode) == 0o700
+        assert not proxy.sock.getsockopt(socket.SOL_SOCKET,
+                                         socket.SO_REUSEPORT)
+    finally:
+        proxy.close()
+        server.close()
+    assert not os.path.exists(backend_dir)